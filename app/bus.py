@@ -0,0 +1,335 @@
+import asyncio
+import os
+import socket
+import tempfile
+import uuid
+from datetime import timezone
+import orjson
+from pymongo.errors import OperationFailure
+from .database import get_database
+
+################################# INVALIDATION BUS #################################
+"""
+Propagation of data changes between the workers of a deployment.
+
+Every worker keeps state in memory (game catalog, token cache,
+rankings). When one worker changes the data, the others are told
+through the invalidation bus and update or drop their copy. Events are
+dicts with a `type`:
+
+- `games`: the list of games changed
+- `user`: a user changed, with its `username`
+- `scores`: scores were stored, with `scores` as `[game_id, user_id, score]` lists
+- `revoked`: sessions were revoked, with `ids` as `[fam, expires_at]` lists
+- `norms`: a new norm table version was stored
+- `reset`: events may have been lost, drop everything
+
+Backends, chosen with `INVALIDATION_BUS`:
+
+- `local` (default): in-process stand-in. Buses sharing a channel
+  stand for the workers of a deployment, an event published on one is
+  delivered to the subscribers of the others. A worker alone on its
+  channel has nobody to tell, which is right for a single worker.
+- `socket`: workers of one host, without a replica set. Each worker
+  binds a Unix datagram socket in `INVALIDATION_SOCKET_DIR` and sends
+  its events to the sockets of the others, they arrive within
+  milliseconds. Sockets left by dead workers are removed when a send to
+  them is refused. An event that does not fit in the receiver's buffer
+  is dropped, the catalog and the token cache still expire after
+  `CATALOG_TTL` and `USER_CACHE_TTL`.
+- `mongo`: MongoDB change streams on `Games`, `Users`, `UserGames`
+  (or `UserGameBuckets`), `TokenFamilies` and `NormTables`.
+  Every write is seen by every worker, whoever made it and even when it
+  comes from a script, so `publish` has nothing to send. Needs a replica
+  set (Atlas clusters are). Changes reach the workers within the change
+  stream latency, usually well under a second. While the stream is down,
+  the catalog and the token cache still expire after `CATALOG_TTL` and
+  `USER_CACHE_TTL`, and a `reset` is delivered if the stream cannot
+  resume where it stopped.
+"""
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+class InvalidationBus:
+    """Base class of the backends"""
+
+    def __init__(self):
+        self.handlers = []
+        # one per bus, several may run in a process
+        self.origin = f"{WORKER_ID}:{uuid.uuid4().hex[:8]}"
+
+    def subscribe(self, handler) -> None:
+        """
+        Register a coroutine function called with every event
+
+        Args:
+            handler: Coroutine function taking the event dict
+        """
+        self.handlers.append(handler)
+
+    async def publish(self, event: dict) -> None:
+        """
+        Announce a change made by this worker to the other ones
+
+        Args:
+            event (dict): The event, `origin` is set to the bus's `origin`
+        """
+        raise NotImplementedError
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def _deliver(self, event: dict) -> None:
+        for handler in self.handlers:
+            try:
+                await handler(event)
+            except Exception as e:
+                print("Cannot apply invalidation event: ", e)
+
+class LocalBus(InvalidationBus):
+    """
+    In-process stand-in, events are delivered to the other buses of the channel
+
+    Args:
+        channel (list): Buses standing for the workers, shared by them, a new one by default
+    """
+
+    def __init__(self, channel: list | None = None):
+        super().__init__()
+        self.channel = channel if channel is not None else []
+        self.channel.append(self)
+
+    async def publish(self, event: dict) -> None:
+        event = {**event, "origin": self.origin}
+        for bus in list(self.channel):
+            if bus is not self:
+                await bus._deliver(event)
+
+    async def stop(self) -> None:
+        if self in self.channel:
+            self.channel.remove(self)
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, queue: asyncio.Queue):
+        self.queue = queue
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.queue.put_nowait(data)
+
+class UnixSocketBus(InvalidationBus):
+    """
+    Events sent as datagrams to the other workers of the host
+
+    Args:
+        directory (str): Directory of the sockets, one per worker, shared by them
+    """
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self._queue = asyncio.Queue()
+        self._transport = None
+        self._socket = None
+        self._task = None
+
+    async def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _DatagramProtocol(self._queue), local_addr=self.path, family=socket.AF_UNIX
+        )
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._transport is not None:
+            self._transport.close()
+            self._socket.close()
+            self._transport = self._socket = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    async def publish(self, event: dict) -> None:
+        data = orjson.dumps({**event, "origin": self.origin})
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path == self.path or not name.endswith(".sock"):
+                continue
+            try:
+                self._socket.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # nobody listens, the worker is gone
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError as e:
+                print("Cannot send invalidation event: ", e)
+
+    async def _run(self) -> None:
+        # one event at a time, in the order they arrived
+        while True:
+            await self._deliver(orjson.loads(await self._queue.get()))
+
+class ChangeStreamBus(InvalidationBus):
+    """
+    Events read from a MongoDB change stream on the data collections
+
+    Args:
+        retry_interval (float): Seconds between attempts to reopen the stream
+    """
+
+    PIPELINE = [
+        {"$match": {
+            "ns.coll": {"$in": ["Games", "Users", "UserGames", "UserGameBuckets", "TokenFamilies", "NormTables"]},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]},
+        }},
+        {"$project": {
+            "ns": 1,
+            "documentKey": 1,
+            "updateDescription.updatedFields": 1,
+            "operationType": 1,
+            "fullDocument.username": 1,
+            "fullDocument.game_id": 1,
+            "fullDocument.user_id": 1,
+            "fullDocument.score": 1,
+            "fullDocument.expires_at": 1,
+            "fullDocument.revoked": 1,
+            "fullDocument.sessions.score": 1,
+        }},
+    ]
+
+    def __init__(self, retry_interval: float = 5):
+        super().__init__()
+        self.retry_interval = retry_interval
+        self._task = None
+
+    async def publish(self, event: dict) -> None:
+        pass
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @staticmethod
+    def _event(change: dict) -> dict | None:
+        collection = change["ns"]["coll"]
+        document = change.get("fullDocument") or {}
+        if collection == "Games":
+            return {"type": "games"}
+        if collection == "Users":
+            # deletes carry no document, drop every cached token
+            if "username" not in document:
+                return {"type": "reset"}
+            return {"type": "user", "username": document["username"]}
+        if collection == "TokenFamilies":
+            # refreshes update the session too, only revocations matter
+            if change["operationType"] == "insert":
+                revoked = document.get("revoked")
+            elif change["operationType"] == "update":
+                revoked = change["updateDescription"]["updatedFields"].get("revoked")
+            else:
+                return None
+            if not revoked:
+                return None
+            expires_at = document["expires_at"].replace(tzinfo=timezone.utc).timestamp()
+            return {"type": "revoked", "ids": [[change["documentKey"]["_id"], expires_at]]}
+        if collection == "NormTables":
+            return {"type": "norms"} if change["operationType"] == "insert" else None
+        if collection == "UserGameBuckets":
+            return ChangeStreamBus._bucket_event(change, document)
+        if change["operationType"] == "insert":
+            return {"type": "scores", "scores": [[document["game_id"], document["user_id"], document["score"]]]}
+        return None
+
+    @staticmethod
+    def _bucket_event(change: dict, document: dict) -> dict | None:
+        if change["operationType"] == "insert":
+            sessions = document.get("sessions", [])
+        elif change["operationType"] == "update":
+            # a $push shows up as `sessions.<index>`
+            sessions = []
+            for field, value in change["updateDescription"]["updatedFields"].items():
+                if field == "sessions":
+                    sessions.extend(value)
+                elif field.startswith("sessions."):
+                    sessions.append(value)
+        else:
+            return None
+        if not sessions:
+            return None
+        return {
+            "type": "scores",
+            "scores": [[document["game_id"], document["user_id"], session["score"]] for session in sessions],
+        }
+
+    async def _run(self) -> None:
+        resume_token = None
+        lost = False
+        while True:
+            try:
+                async with get_database().watch(
+                    self.PIPELINE, full_document="updateLookup", resume_after=resume_token
+                ) as stream:
+                    if lost:
+                        await self._deliver({"type": "reset"})
+                        lost = False
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        event = self._event(change)
+                        if event is not None:
+                            await self._deliver(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("Invalidation stream interrupted: ", e)
+                if isinstance(e, OperationFailure) and resume_token is not None:
+                    # the oplog no longer has the resume point
+                    resume_token = None
+                lost = lost or resume_token is None
+                await asyncio.sleep(self.retry_interval)
+
+def bus_from_env() -> InvalidationBus:
+    """
+    Create the invalidation bus
+
+    Settings:
+        - `INVALIDATION_BUS`: `local` (default), `socket` or `mongo`
+        - `INVALIDATION_RETRY_INTERVAL`: seconds between attempts to reopen the change stream (default 5)
+        - `INVALIDATION_SOCKET_DIR`: directory of the worker sockets, one per
+          deployment (default `cognitive-games-bus` in the temporary directory)
+
+    Returns:
+        InvalidationBus: The bus, not started
+    """
+    kind = os.getenv("INVALIDATION_BUS", "local")
+    if kind == "mongo":
+        return ChangeStreamBus(retry_interval=float(os.getenv("INVALIDATION_RETRY_INTERVAL", "5")))
+    if kind == "socket":
+        return UnixSocketBus(
+            os.getenv("INVALIDATION_SOCKET_DIR", os.path.join(tempfile.gettempdir(), "cognitive-games-bus"))
+        )
+    if kind == "local":
+        return LocalBus()
+    raise ValueError(f"Unknown INVALIDATION_BUS: {kind}")
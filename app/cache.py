@@ -0,0 +1,130 @@
+import time
+from collections import OrderedDict
+
+################################# CACHE #################################
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries expire after a time to live
+
+    Every entry has its own expiry time, so callers can shorten it
+    below the default (e.g. to the `exp` claim of a token).
+    Not thread safe, it is meant to be used from the event loop.
+
+    Args:
+        maxsize (int): Maximum number of entries, the least recently used is evicted
+        ttl (float): Default time to live in seconds
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        """
+        Get a cached value
+
+        Args:
+            key: The key
+            default: Returned when the key is missing or expired
+
+        Returns:
+            The cached value or `default`
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl: float | None = None) -> None:
+        """
+        Cache a value
+
+        Args:
+            key: The key
+            value: The value
+            ttl (float): Time to live in seconds, defaults to the cache ttl
+        """
+        if ttl is None:
+            ttl = self.ttl
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """
+        Get the cache counters
+
+        Returns:
+            dict: `hits`, `misses` and current `size`
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+class TokenUserCache(TTLCache):
+    """
+    Cache of decoded access tokens and their user documents
+
+    Keyed by the raw token. An entry never outlives the `exp` claim
+    of its token, and is dropped when its user is updated.
+    """
+
+    def get_user(self, token: str):
+        """
+        Get the cached claims and user of a token
+
+        Args:
+            token (str): The access token
+
+        Returns:
+            tuple: `(payload, user)` or None on a miss
+        """
+        return self.get(token)
+
+    def set_user(self, token: str, payload: dict, user: dict) -> None:
+        """
+        Cache the claims and user of a token until the token expires
+
+        Args:
+            token (str): The access token
+            payload (dict): The decoded claims
+            user (dict): The user document
+        """
+        ttl = self.ttl
+        expires = payload.get("exp")
+        if expires is not None:
+            ttl = min(ttl, expires - time.time())
+        if ttl > 0:
+            self.set(token, (payload, user), ttl)
+
+    def invalidate_user(self, username: str) -> None:
+        """
+        Drop every cached token of a user
+
+        Args:
+            username (str): The username
+        """
+        stale = [
+            token for token, ((_, user), _) in self._entries.items()
+            if user["username"] == username
+        ]
+        for token in stale:
+            del self._entries[token]
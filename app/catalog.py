@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import os
+from .cache import TTLCache
+from .database import games_repository
+from .encoding import JSON, serialize, compress
+
+################################# CATALOG #################################
+
+class GameCatalog:
+    """
+    In-memory copy of the `Games` collection
+
+    The catalog only changes through `POST /games`, which calls
+    `invalidate`. It is also reloaded after `CATALOG_TTL` seconds
+    (default 300) to pick up games created by other workers.
+    """
+
+    def __init__(self, ttl: float):
+        self._cache = TTLCache(maxsize=1, ttl=ttl)
+        self._lock = asyncio.Lock()
+        # bumped by `invalidate`, a load that saw it change read stale games
+        self._generation = 0
+
+    @property
+    def ttl(self) -> float:
+        return self._cache.ttl
+
+    @ttl.setter
+    def ttl(self, ttl: float) -> None:
+        self._cache.ttl = ttl
+
+    async def _load(self) -> dict:
+        entry = self._cache.get("catalog")
+        if entry is not None:
+            return entry
+        async with self._lock:
+            entry = self._cache.get("catalog")
+            if entry is None:
+                generation = self._generation
+                games = [
+                    {"id": game["id"], "game_type": game["game_type"]}
+                    for game in await games_repository.list()
+                ]
+                body = serialize(games, JSON)
+                entry = {
+                    "games": games,
+                    "by_id": {game["id"]: game for game in games},
+                    "etag": hashlib.sha256(body).hexdigest()[:32],
+                    "encoded": {(JSON, None): body},
+                }
+                if generation == self._generation:
+                    self._cache.set("catalog", entry)
+        return entry
+
+    async def list(self) -> list:
+        """
+        Get all games
+
+        Returns:
+            list: The games, with `id` and `game_type`
+        """
+        return (await self._load())["games"]
+
+    async def body(self, media: str = JSON, coding: str | None = None) -> bytes:
+        """
+        Get all games serialized for the `/games` response
+
+        Args:
+            media (str): `JSON` (a JSON array) or `MSGPACK`, see `app.encoding`
+            coding (str): `br`, `gzip` or None
+
+        Returns:
+            bytes: The body, encoded once per load
+        """
+        entry = await self._load()
+        body = entry["encoded"].get((media, coding))
+        if body is None:
+            body = compress(serialize(entry["games"], media), coding)
+            entry["encoded"][(media, coding)] = body
+        return body
+
+    async def get(self, game_id: int) -> dict | None:
+        """
+        Get a game by id
+
+        Args:
+            game_id (int): The game id
+
+        Returns:
+            dict: The game or None
+        """
+        return (await self._load())["by_id"].get(game_id)
+
+    async def etag(self, media: str = JSON, coding: str | None = None) -> str:
+        """
+        Get the strong ETag of a representation of the catalog
+
+        Args:
+            media (str): `JSON` or `MSGPACK`
+            coding (str): `br`, `gzip` or None
+
+        Returns:
+            str: The quoted ETag, it changes whenever the list of games changes
+        """
+        etag = (await self._load())["etag"]
+        if media != JSON:
+            etag += "-" + media.rsplit("/", 1)[-1]
+        if coding is not None:
+            etag += "-" + coding
+        return '"' + etag + '"'
+
+    def invalidate(self) -> None:
+        """Drop the catalog, the next read loads it again"""
+        self._generation += 1
+        self._cache.clear()
+
+game_catalog = GameCatalog(ttl=float(os.getenv("CATALOG_TTL", "300")))
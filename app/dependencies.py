@@ -1,9 +1,13 @@
 from dotenv import load_dotenv
 from urllib.parse import quote_plus
 import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
+from fastapi.exceptions import HTTPException
 from pymongo import MongoClient
+from .metrics import bcrypt_duration
 
 ### Authentication ###
 
@@ -29,14 +33,147 @@ def verify_password(plain_password, hashed_password):
     """
     return pwd_context.verify(plain_password, hashed_password)
 
-def get_password_hash(password):
+def get_password_hash(password, rounds=None):
     """
     Get the password hash
     
     Args:
         password (str): The password
+        rounds (int): The bcrypt cost factor, defaults to `BCRYPT_ROUNDS`
     
     Returns:
         str: The hashed password
     """
-    return pwd_context.hash(password)
+    if rounds is None:
+        rounds = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    return pwd_context.using(bcrypt__rounds=rounds).hash(password)
+
+# Hashing pool
+
+"""
+bcrypt takes 100-300 ms of CPU per call, so it runs in a worker pool
+instead of on the event loop thread. Settings:
+
+- `HASHING_EXECUTOR`: `thread` (default) or `process`
+- `HASHING_WORKERS`: pool size (default cpu count), 0 runs inline
+- `HASHING_QUEUE_LIMIT`: calls allowed to wait for a worker (default 4 per worker)
+- `BCRYPT_ROUNDS`: cost factor for new hashes (default 12)
+
+When all workers are busy and the queue is full the call is rejected
+with a 503 instead of piling up behind the pool.
+"""
+
+busy_exception = HTTPException(
+    status_code=503,
+    detail="Server is busy, try again later",
+    headers={"Retry-After": "1"},
+)
+
+class HashingPool:
+    """
+    Bounded executor for password hashing
+
+    Args:
+        workers (int): Number of workers, 0 runs every call inline
+        queue_limit (int): Calls allowed to wait for a free worker
+        kind (str): `thread` or `process`
+    """
+
+    def __init__(self, workers: int, queue_limit: int, kind: str = "thread"):
+        self.workers = workers
+        self.limit = workers + queue_limit
+        self.pending = 0
+        self.executor = None
+        if workers > 0:
+            executor_class = ProcessPoolExecutor if kind == "process" else ThreadPoolExecutor
+            self.executor = executor_class(max_workers=workers)
+
+    async def run(self, function, *args):
+        """
+        Run a function in the pool
+
+        Args:
+            function: A picklable module level function
+            *args: Its arguments
+
+        Returns:
+            The function result
+
+        Raises:
+            busy_exception: If the pool and its queue are full
+        """
+        if self.executor is None:
+            return function(*args)
+        if self.pending >= self.limit:
+            raise busy_exception
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, function, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        """Stop the workers"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+_hashing_pool = None
+
+def get_hashing_pool() -> HashingPool:
+    """
+    Get the shared hashing pool, creating it on first use
+
+    Returns:
+        HashingPool: The pool
+    """
+    global _hashing_pool
+    if _hashing_pool is None:
+        workers = int(os.getenv("HASHING_WORKERS", str(os.cpu_count() or 1)))
+        _hashing_pool = HashingPool(
+            workers=workers,
+            queue_limit=int(os.getenv("HASHING_QUEUE_LIMIT", str(workers * 4))),
+            kind=os.getenv("HASHING_EXECUTOR", "thread"),
+        )
+    return _hashing_pool
+
+def shutdown_hashing_pool() -> None:
+    """Stop the shared hashing pool"""
+    global _hashing_pool
+    if _hashing_pool is not None:
+        _hashing_pool.shutdown()
+    _hashing_pool = None
+
+async def verify_password_async(plain_password, hashed_password):
+    """
+    Verify the password in the hashing pool
+
+    Args:
+        plain_password (str): The plain password
+        hashed_password (str): The hashed password
+
+    Returns:
+        bool: True if the password is verified, False otherwise
+
+    Raises:
+        busy_exception: If the hashing pool is saturated
+    """
+    with bcrypt_duration.time(operation="verify"):
+        return await get_hashing_pool().run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    """
+    Get the password hash in the hashing pool
+
+    Args:
+        password (str): The password
+
+    Returns:
+        str: The hashed password
+
+    Raises:
+        busy_exception: If the hashing pool is saturated
+    """
+    rounds = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    with bcrypt_duration.time(operation="hash"):
+        return await get_hashing_pool().run(get_password_hash, password, rounds)
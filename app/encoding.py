@@ -0,0 +1,177 @@
+import gzip
+import os
+import brotli
+import orjson
+import ormsgpack
+from fastapi import Request
+from fastapi.responses import Response
+from .records import encode_default
+
+################################# ENCODING #################################
+"""
+Negotiated encodings of the history routes (`/users/games/{game_id}`,
+`/games`), for clients on slow mobile networks.
+
+- Format, from `Accept`: JSON by default, MessagePack with the same
+  structure for `application/msgpack` (or `application/x-msgpack`).
+  Dates are ISO 8601 strings in both.
+- Compression, from `Accept-Encoding`: brotli (`br`), preferred, or
+  gzip. Bodies smaller than `COMPRESSION_MIN_SIZE` are sent as they
+  are, compressing them costs more CPU than the bytes it saves.
+
+Settings:
+
+- `COMPRESSION_MIN_SIZE`: smallest body compressed, in bytes (default 1024)
+- `BROTLI_QUALITY`: 0 to 11 (default 4)
+- `GZIP_LEVEL`: 1 to 9 (default 6)
+"""
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+CODINGS = ("br", "gzip")
+
+compression_min_size = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+brotli_quality = int(os.getenv("BROTLI_QUALITY", "4"))
+gzip_level = int(os.getenv("GZIP_LEVEL", "6"))
+
+def load_settings() -> None:
+    """Read the compression settings from the environment again"""
+    global compression_min_size, brotli_quality, gzip_level
+    compression_min_size = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    brotli_quality = int(os.getenv("BROTLI_QUALITY", "4"))
+    gzip_level = int(os.getenv("GZIP_LEVEL", "6"))
+
+def _weights(header: str) -> dict:
+    """Parse an `Accept` or `Accept-Encoding` header into `{value: q}`"""
+    weights = {}
+    for item in header.split(","):
+        value, *parameters = item.split(";")
+        value = value.strip().lower()
+        if not value:
+            continue
+        q = 1.0
+        for parameter in parameters:
+            name, _, number = parameter.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        weights[value] = max(q, weights.get(value, 0.0))
+    return weights
+
+def media_type(request: Request) -> str:
+    """
+    Choose the format of the response
+
+    Args:
+        request (Request): The request
+
+    Returns:
+        str: `MSGPACK` when the client prefers it to JSON, else `JSON`
+    """
+    weights = _weights(request.headers.get("accept", ""))
+    msgpack_q = max(weights.get(value, 0.0) for value in MSGPACK_TYPES)
+    if msgpack_q == 0:
+        return JSON
+    json_q = max(weights.get(value, 0.0) for value in (JSON, "application/*", "*/*"))
+    return MSGPACK if msgpack_q >= json_q else JSON
+
+def content_coding(request: Request, size: int) -> str | None:
+    """
+    Choose the compression of the response
+
+    Args:
+        request (Request): The request
+        size (int): Size of the uncompressed body
+
+    Returns:
+        str: `br`, `gzip` or None to send the body as it is
+    """
+    if size < compression_min_size:
+        return None
+    weights = _weights(request.headers.get("accept-encoding", ""))
+    best, best_q = None, 0.0
+    for coding in CODINGS:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+def serialize(content, media: str) -> bytes:
+    """
+    Encode content as JSON or MessagePack
+
+    Args:
+        content: Anything `ORJSONResponse` can render
+        media (str): `JSON` or `MSGPACK`
+
+    Returns:
+        bytes: The body
+    """
+    if media == MSGPACK:
+        return ormsgpack.packb(
+            content, default=encode_default, option=ormsgpack.OPT_NON_STR_KEYS | ormsgpack.OPT_SERIALIZE_NUMPY
+        )
+    return orjson.dumps(content, default=encode_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+def compress(body: bytes, coding: str | None) -> bytes:
+    """
+    Args:
+        body (bytes): The body
+        coding (str): `br`, `gzip` or None
+
+    Returns:
+        bytes: The compressed body, or the body itself when `coding` is None
+    """
+    if coding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    if coding == "gzip":
+        return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+    return body
+
+def encoded_response(request: Request, body: bytes, media: str, headers: dict | None = None) -> Response:
+    """
+    Build a response from a serialized body, compressed if the client accepts it
+
+    Args:
+        request (Request): The request
+        body (bytes): The body, as returned by `serialize`
+        media (str): Its media type
+        headers (dict): Extra headers
+
+    Returns:
+        Response: The response, with `Content-Encoding` and `Vary` set
+    """
+    coding = content_coding(request, len(body))
+    return Response(compress(body, coding), media_type=media, headers=response_headers(coding, headers))
+
+def response_headers(coding: str | None, headers: dict | None = None) -> dict:
+    """
+    Args:
+        coding (str): The compression, as returned by `content_coding`
+        headers (dict): Other headers of the response
+
+    Returns:
+        dict: The headers with `Vary` and, if compressed, `Content-Encoding`
+    """
+    headers = {**(headers or {}), "Vary": "Accept, Accept-Encoding"}
+    if coding is not None:
+        headers["Content-Encoding"] = coding
+    return headers
+
+def negotiated_response(request: Request, content, headers: dict | None = None) -> Response:
+    """
+    Serialize content in the format the client asked for, compressed if it accepts it
+
+    Args:
+        request (Request): The request
+        content: Anything `ORJSONResponse` can render
+        headers (dict): Extra headers
+
+    Returns:
+        Response: The response
+    """
+    media = media_type(request)
+    return encoded_response(request, serialize(content, media), media, headers)
@@ -0,0 +1,151 @@
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import PyMongoError
+from .database import get_database
+
+################################# INDEXES #################################
+"""
+Every query issued by the routes must be served by one of these indexes.
+`create_indexes` is run when a worker starts, creating an index that
+already exists is a no-op on the server.
+"""
+
+INDEXES = {
+    "Users": [
+        IndexModel([("username", ASCENDING)], unique=True, name="username_unique"),
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+    ],
+    "Games": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+    ],
+    "UserGames": [
+        IndexModel(
+            [("user_id", ASCENDING), ("game_id", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)],
+            name="user_id_game_id_date_id",
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("idempotency_key", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"idempotency_key": {"$exists": True}},
+            name="user_id_idempotency_key_unique",
+        ),
+    ],
+    "UserGameBuckets": [
+        IndexModel([("user_id", ASCENDING), ("game_id", ASCENDING), ("month", ASCENDING)], name="user_id_game_id_month"),
+        IndexModel(
+            [("user_id", ASCENDING), ("sessions.idempotency_key", ASCENDING)],
+            unique=True,
+            name="user_id_sessions_idempotency_key_unique",
+        ),
+    ],
+    "GameStatistics": [
+        IndexModel([("game_id", ASCENDING)], unique=True, name="game_id_unique"),
+    ],
+    "UserGameStatistics": [
+        IndexModel([("user_id", ASCENDING), ("game_id", ASCENDING)], unique=True, name="user_id_game_id_unique"),
+    ],
+    "TokenFamilies": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+    "UserGameRollups": [
+        IndexModel(
+            [("user_id", ASCENDING), ("game_id", ASCENDING), ("granularity", ASCENDING), ("period", ASCENDING)],
+            unique=True,
+            name="user_id_game_id_granularity_period_unique",
+        ),
+    ],
+    "UserGameRounds": [
+        IndexModel(
+            [("user_id", ASCENDING), ("game_id", ASCENDING), ("date", ASCENDING), ("_id", ASCENDING)],
+            name="user_id_game_id_date_id",
+        ),
+    ],
+}
+
+async def create_indexes() -> None:
+    """
+    Create all declared indexes
+
+    Collections are handled one by one, an index that can not be built
+    on one collection does not keep the others from getting theirs.
+
+    Raises:
+        RuntimeError: After trying every collection, if any index could
+            not be built, e.g. a unique index over duplicated values.
+            The message names every failing collection.
+    """
+    db = get_database()
+    failures = {}
+    for collection_name, indexes in INDEXES.items():
+        try:
+            await db[collection_name].create_indexes(indexes)
+        except PyMongoError as e:
+            failures[collection_name] = e
+    if failures:
+        raise RuntimeError("; ".join(f"{name}: {error}" for name, error in failures.items()))
+
+################################# QUERY PLANS #################################
+"""
+Queries issued by the routes, as (collection, filter) pairs.
+Keep in sync with the repositories when a query is added or changed.
+"""
+
+ROUTE_QUERIES = [
+    ("Users", {"username": "johndoe"}),
+    ("Users", {"id": "00000000-0000-0000-0000-000000000000"}),
+    ("Games", {"id": 1}),
+    ("UserGames", {"user_id": "00000000-0000-0000-0000-000000000000", "game_id": 1}),
+    ("UserGames", {"user_id": "00000000-0000-0000-0000-000000000000"}),
+    ("UserGameBuckets", {"user_id": "00000000-0000-0000-0000-000000000000", "game_id": 1}),
+    ("UserGameBuckets", {"user_id": "00000000-0000-0000-0000-000000000000"}),
+    ("GameStatistics", {"game_id": 1}),
+    ("UserGameStatistics", {"user_id": "00000000-0000-0000-0000-000000000000", "game_id": 1}),
+    ("UserGameRollups", {"user_id": "00000000-0000-0000-0000-000000000000", "game_id": 1, "granularity": "day"}),
+    ("UserGameRounds", {"user_id": "00000000-0000-0000-0000-000000000000", "game_id": 1}),
+]
+
+def _plan_stages(plan: dict):
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+async def find_collection_scans() -> list:
+    """
+    Explain every route query and collect those planned as a collection scan
+
+    Returns:
+        list: The (collection, filter) pairs using `COLLSCAN`
+    """
+    db = get_database()
+    scans = []
+    for collection_name, query in ROUTE_QUERIES:
+        explanation = await db[collection_name].find(query).explain()
+        winning_plan = explanation["queryPlanner"]["winningPlan"]
+        if "COLLSCAN" in _plan_stages(winning_plan):
+            scans.append((collection_name, query))
+    return scans
+
+async def assert_no_collection_scans() -> None:
+    """
+    Fail if any route query would scan a whole collection
+
+    Raises:
+        AssertionError: If a route query is planned as `COLLSCAN`
+    """
+    scans = await find_collection_scans()
+    assert not scans, f"Route queries doing a collection scan: {scans}"
+
+if __name__ == "__main__":
+    import asyncio
+    from dotenv import load_dotenv
+
+    async def main():
+        await create_indexes()
+        await assert_no_collection_scans()
+
+    load_dotenv()
+    asyncio.run(main())
+    print("Indexes created, no route query does a collection scan")
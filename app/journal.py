@@ -0,0 +1,221 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+from bson import json_util
+from .database import user_games_repository
+from .rounds import session_rounds, rounds_document
+
+################################# JOURNAL #################################
+"""
+Write-behind mode for score submissions.
+
+A score is acknowledged once it is appended and fsynced to a local
+journal. A background task moves the journaled scores to MongoDB with
+`insert_many`, every `flush_interval` seconds or as soon as
+`flush_size` scores are waiting.
+
+The journal is split in segment files. A segment is deleted only
+after all its scores are in MongoDB and were passed to `on_flush`
+(which adds them to the aggregates), and segments left by a crash are replayed on start.
+Scores get their `_id` before being journaled, so replaying a segment
+that was partly flushed does not duplicate rows. A score whose segment
+is still there was not passed to `on_flush` yet, so `on_flush` gets
+every score of the flush, including those an earlier attempt or run
+already inserted (reported as duplicates).
+
+Aggregates are updated at most once per score: once `on_flush` was
+called the segments are deleted even if it fails, as some of its
+writes may have landed. Its error is reported, and the scores it
+missed are added back by rebuilding the aggregates
+(`python -m app.statistics`, `python -m app.rollups`). A crash while
+`on_flush` runs, before the segments are deleted, is the exception:
+the replay adds the scores whose writes had landed a second time.
+
+Scores may carry the packed per-round data of their session under
+`rounds`, it is written to `UserGameRounds` by the same flush.
+"""
+
+class ScoreJournal:
+    """
+    Args:
+        directory (str): Where segment files are written
+        flush_size (int): Flush as soon as this many scores are waiting
+        flush_interval (float): Flush at least this often, in seconds
+        on_flush: Coroutine called with the documents of a flush once they are all stored
+    """
+
+    def __init__(self, directory: str, flush_size: int, flush_interval: float, on_flush=None):
+        self.directory = Path(directory)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.pending = []
+        self.flushed_segments = []
+        self.flush_count = 0
+        self.flushed_documents = 0
+        self.last_flush_seconds = 0.0
+        self._segment = None
+        self._segment_path = None
+        self._sequence = 0
+        self._write_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    # Segments
+
+    def _open_segment(self) -> None:
+        self._sequence += 1
+        self._segment_path = self.directory / f"scores-{time.time_ns()}-{self._sequence}.ndjson"
+        self._segment = open(self._segment_path, "ab")
+
+    def _rotate(self) -> Path:
+        path = self._segment_path
+        self._segment.close()
+        self._open_segment()
+        return path
+
+    def _write(self, lines: bytes) -> None:
+        self._segment.write(lines)
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+
+    # Lifecycle
+
+    async def start(self) -> None:
+        """Replay segments left by a previous run and start the flush task"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        leftovers = sorted(self.directory.glob("scores-*.ndjson"))
+        self._open_segment()
+        for path in leftovers:
+            with open(path, "rb") as segment:
+                for line in segment:
+                    if line.strip():
+                        self.pending.append(json_util.loads(line))
+        self.flushed_segments.extend(leftovers)
+        self._task = asyncio.create_task(self._run())
+        if self.pending:
+            self._wakeup.set()
+
+    async def stop(self) -> None:
+        """Stop the flush task and flush what is left"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        finally:
+            self._segment.close()
+            if not self.pending and self._segment_path.stat().st_size == 0:
+                self._segment_path.unlink()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print("Cannot flush score journal: ", e)
+
+    # Writes
+
+    async def append(self, user_games: list) -> None:
+        """
+        Journal scores, they are durable once this returns
+
+        Args:
+            user_games (list): Documents with their `_id` already set
+        """
+        lines = b"".join(json_util.dumps(user_game).encode() + b"\n" for user_game in user_games)
+        async with self._write_lock:
+            await asyncio.to_thread(self._write, lines)
+            self.pending.extend(user_games)
+        if len(self.pending) >= self.flush_size:
+            self._wakeup.set()
+
+    async def flush(self) -> None:
+        """Move every journaled score to MongoDB"""
+        async with self._flush_lock:
+            async with self._write_lock:
+                if not self.pending:
+                    return
+                documents = self.pending
+                self.pending = []
+                self.flushed_segments.append(self._rotate())
+            start = time.perf_counter()
+            user_games = [
+                {key: value for key, value in document.items() if key != "rounds"} for document in documents
+            ]
+            try:
+                errors = await user_games_repository.insert_many(user_games)
+                failed = [error for error in errors.values() if error["code"] != 11000]
+                if not failed:
+                    await session_rounds.insert_many([
+                        rounds_document(document, document["rounds"]) for document in documents if "rounds" in document
+                    ])
+            except Exception:
+                self.pending = documents + self.pending
+                raise
+            if failed:
+                self.pending = documents + self.pending
+                raise RuntimeError(f"{len(failed)} scores could not be flushed: {failed[0]['errmsg']}")
+            try:
+                if self.on_flush is not None:
+                    # duplicates were inserted by an attempt that did not get here
+                    await self.on_flush(user_games)
+            finally:
+                # the scores are stored, part of the aggregates may be too: never requeued
+                for path in self.flushed_segments:
+                    path.unlink(missing_ok=True)
+                self.flushed_segments = []
+                self.last_flush_seconds = time.perf_counter() - start
+                self.flush_count += 1
+                self.flushed_documents += len(documents)
+
+    def stats(self) -> dict:
+        """
+        Get the journal counters
+
+        Returns:
+            dict: `queue_depth`, `flush_count`, `flushed_documents` and `last_flush_seconds`
+        """
+        return {
+            "queue_depth": len(self.pending),
+            "flush_count": self.flush_count,
+            "flushed_documents": self.flushed_documents,
+            "last_flush_seconds": self.last_flush_seconds,
+        }
+
+def journal_from_env(on_flush=None) -> ScoreJournal | None:
+    """
+    Create the journal when write-behind mode is enabled
+
+    Settings:
+        - `WRITE_BEHIND`: `1` to enable (default off)
+        - `JOURNAL_DIR`: segment directory (default `journal`)
+        - `JOURNAL_FLUSH_SIZE`: scores per flush (default 500)
+        - `JOURNAL_FLUSH_INTERVAL`: seconds between flushes (default 1)
+
+    Args:
+        on_flush: Coroutine called with the documents of a flush once they are all stored
+
+    Returns:
+        ScoreJournal: The journal or None when write-behind is off
+    """
+    if os.getenv("WRITE_BEHIND", "0") != "1":
+        return None
+    return ScoreJournal(
+        directory=os.getenv("JOURNAL_DIR", "journal"),
+        flush_size=int(os.getenv("JOURNAL_FLUSH_SIZE", "500")),
+        flush_interval=float(os.getenv("JOURNAL_FLUSH_INTERVAL", "1")),
+        on_flush=on_flush,
+    )
@@ -0,0 +1,149 @@
+from sortedcontainers import SortedKeyList
+from .database import user_games_repository
+
+################################# RANKINGS #################################
+"""
+Every player is ranked by their best score in a game, higher is better.
+Rankings live in memory: a sorted list of `(best score, user id)` per
+game gives top-N, neighbours and rank lookups in O(log players).
+
+They are rebuilt from `UserGames` when the worker starts and updated by
+every stored score.
+"""
+
+class GameRanking:
+    """Best score of every player of one game, kept sorted"""
+
+    def __init__(self):
+        self.best = {}
+        self.ranked = SortedKeyList(key=lambda entry: (-entry[0], entry[1]))
+
+    def record(self, user_id: str, score: float) -> None:
+        """
+        Add a score of a player
+
+        Args:
+            user_id (str): The user id
+            score (float): The score
+        """
+        best = self.best.get(user_id)
+        if best is not None:
+            if best >= score:
+                return
+            self.ranked.remove((best, user_id))
+        self.best[user_id] = score
+        self.ranked.add((score, user_id))
+
+    def rank(self, user_id: str) -> int | None:
+        """
+        Get the rank of a player, 1 is the best
+
+        Args:
+            user_id (str): The user id
+
+        Returns:
+            int: The rank or None if the user did not play
+        """
+        best = self.best.get(user_id)
+        if best is None:
+            return None
+        return self.ranked.index((best, user_id)) + 1
+
+    def top(self, limit: int, start: int = 0) -> list:
+        """
+        Get a slice of the leaderboard
+
+        Args:
+            limit (int): Number of players
+            start (int): Index of the first player, 0 is the best
+
+        Returns:
+            list: `{"rank", "user_id", "score"}` entries
+        """
+        start = max(start, 0)
+        return [
+            {"rank": start + offset + 1, "user_id": user_id, "score": score}
+            for offset, (score, user_id) in enumerate(self.ranked[start:start + limit])
+        ]
+
+    def percentile(self, user_id: str) -> float | None:
+        """
+        Get the share of players whose best score is lower
+
+        Args:
+            user_id (str): The user id
+
+        Returns:
+            float: Percentile from 0 to 100, None if the user did not play
+        """
+        best = self.best.get(user_id)
+        if best is None:
+            return None
+        # entries are ordered by (-score, user_id), user ids sort before "\uffff"
+        lower = len(self.ranked) - self.ranked.bisect_key_right((-best, "\uffff"))
+        return 100.0 * lower / len(self.ranked)
+
+class Rankings:
+    """Rankings of all games"""
+
+    def __init__(self):
+        self.games = {}
+        self._recorded_during_rebuild = None
+
+    def game(self, game_id: int) -> GameRanking:
+        """
+        Get the ranking of a game
+
+        Args:
+            game_id (int): The game id
+
+        Returns:
+            GameRanking: The ranking, empty if nobody played
+        """
+        ranking = self.games.get(game_id)
+        if ranking is None:
+            ranking = self.games[game_id] = GameRanking()
+        return ranking
+
+    def record(self, game_id: int, user_id: str, score: float) -> None:
+        """
+        Add a stored score to the rankings
+
+        Args:
+            game_id (int): The game id
+            user_id (str): The user id
+            score (float): The score
+        """
+        self.game(game_id).record(user_id, score)
+        if self._recorded_during_rebuild is not None:
+            self._recorded_during_rebuild.append((game_id, user_id, score))
+
+    async def rebuild(self) -> None:
+        """
+        Rebuild all rankings from the best score of every player
+
+        Scores recorded while the rebuild runs are kept.
+        """
+        games = {}
+        self._recorded_during_rebuild = []
+        try:
+            rows = user_games_repository.aggregate({}, [
+                {"$group": {"_id": {"game_id": "$game_id", "user_id": "$user_id"}, "best": {"$max": "$score"}}},
+            ], allowDiskUse=True)
+            async for row in rows:
+                game_id = row["_id"]["game_id"]
+                ranking = games.get(game_id)
+                if ranking is None:
+                    ranking = games[game_id] = GameRanking()
+                ranking.best[row["_id"]["user_id"]] = row["best"]
+            for ranking in games.values():
+                ranking.ranked.update((score, user_id) for user_id, score in ranking.best.items())
+            for game_id, user_id, score in self._recorded_during_rebuild:
+                if game_id not in games:
+                    games[game_id] = GameRanking()
+                games[game_id].record(user_id, score)
+            self.games = games
+        finally:
+            self._recorded_during_rebuild = None
+
+rankings = Rankings()
@@ -0,0 +1,223 @@
+import threading
+import time
+from contextlib import contextmanager
+from pymongo import monitoring
+
+################################# METRICS #################################
+"""
+Minimal Prometheus-style metrics, rendered in the text exposition
+format on `/metrics`.
+
+Metrics are updated from the event loop and from worker threads
+(hashing pool, MongoDB command listener), every update takes a lock.
+"""
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key: tuple, value) -> list:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}"]
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+            state[1] += 1
+            state[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the `with` block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_value(self, key: tuple, state) -> list:
+        bucket_counts, count, total = state
+        lines = []
+        for bound, bucket_count in zip(self.buckets + ("+Inf",), bucket_counts + [count]):
+            labels = _format_labels(self.label_names, key, 'le="%s"' % bound)
+            lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_count{labels} {count}")
+        lines.append(f"{self.name}_sum{labels} {total}")
+        return lines
+
+REGISTRY = []
+COLLECTORS = []
+
+def register_collector(collector) -> None:
+    """
+    Register a function called before every render, used to copy
+    counters kept elsewhere (caches, pools, journal) into gauges
+
+    Args:
+        collector: Function without arguments
+    """
+    COLLECTORS.append(collector)
+
+def render() -> str:
+    """
+    Render all metrics
+
+    Returns:
+        str: The text exposition format
+    """
+    for collector in COLLECTORS:
+        collector()
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+################################# APPLICATION METRICS #################################
+
+http_requests = Counter("http_requests_total", "HTTP requests", ("method", "route", "status"))
+http_request_duration = Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests being served")
+mongo_command_duration = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ("collection", "command", "outcome")
+)
+bcrypt_duration = Histogram("bcrypt_duration_seconds", "bcrypt hashing and verification time", ("operation",))
+jwt_duration = Histogram("jwt_duration_seconds", "JWT encoding and decoding time", ("operation",))
+hashing_pool_pending = Gauge("hashing_pool_pending", "Password hashing calls running or waiting")
+user_cache_hits = Gauge("user_cache_hits", "Token cache hits since start")
+user_cache_misses = Gauge("user_cache_misses", "Token cache misses since start")
+user_cache_size = Gauge("user_cache_size", "Tokens in the cache")
+journal_queue_depth = Gauge("journal_queue_depth", "Journaled scores waiting for a flush")
+journal_flushed_documents = Gauge("journal_flushed_documents", "Scores flushed from the journal since start")
+journal_last_flush_seconds = Gauge("journal_last_flush_seconds", "Duration of the last journal flush")
+rate_limited_requests = Counter("rate_limited_requests_total", "Requests rejected by a rate limiter", ("limiter",))
+coalesced_requests = Counter(
+    "coalesced_requests_total", "Requests served by a computation already in flight", ("flight",)
+)
+invalidation_events = Counter("invalidation_events_total", "Invalidation events applied from other workers", ("type",))
+
+################################# MIDDLEWARE #################################
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency, status and in-flight requests
+    per route template (e.g. `/users/games/{game_id}`)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            http_request_duration.observe(elapsed, method=scope["method"], route=route_path)
+            http_requests.inc(method=scope["method"], route=route_path, status=status)
+
+################################# MONGODB #################################
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    Record the latency of every MongoDB command by collection and command,
+    registered on the client with `event_listeners`
+    """
+
+    def __init__(self):
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._collections[event.request_id] = collection if isinstance(collection, str) else ""
+
+    def _finish(self, event, outcome: str) -> None:
+        with self._lock:
+            collection = self._collections.pop(event.request_id, "")
+        mongo_command_duration.observe(
+            event.duration_micros / 1e6, collection=collection, command=event.command_name, outcome=outcome
+        )
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+from .database import UserGamesRepository, BucketedUserGamesRepository, get_database
+from .indexes import INDEXES
+
+################################# MIGRATION #################################
+"""
+Copy the played games from the flat layout (`UserGames`) to the bucket
+layout (`UserGameBuckets`).
+
+    python -m app.migrate_user_games
+    python -m app.migrate_user_games --verify
+
+Sessions keep their `_id`, which is also their idempotency key, so the
+migration can be stopped and run again: sessions already copied are
+skipped as duplicates. To switch without losing scores:
+
+1. run the migration while the workers still use the flat layout
+2. restart the workers with `USER_GAMES_LAYOUT=bucketed`
+3. run the migration again to copy the scores stored in between
+
+`UserGames` is left untouched, drop it once the bucket layout is
+verified.
+"""
+
+async def migrate(batch_size: int = 1000) -> dict:
+    """
+    Copy every flat document into buckets
+
+    Args:
+        batch_size (int): Sessions written per bulk write
+
+    Returns:
+        dict: Number of sessions `copied`, `skipped` (already copied) and `failed`
+    """
+    await get_database()["UserGameBuckets"].create_indexes(INDEXES["UserGameBuckets"])
+    flat = UserGamesRepository()
+    buckets = BucketedUserGamesRepository()
+    counts = {"copied": 0, "skipped": 0, "failed": 0}
+
+    async def write(batch: list) -> None:
+        errors = await buckets.insert_many(batch)
+        skipped = sum(1 for error in errors.values() if error["code"] == 11000)
+        counts["skipped"] += skipped
+        counts["failed"] += len(errors) - skipped
+        counts["copied"] += len(batch) - len(errors)
+        for index, error in errors.items():
+            if error["code"] != 11000:
+                print("Cannot copy", batch[index]["_id"], error["errmsg"])
+
+    batch = []
+    async for user_game in flat.iter_sessions(batch_size):
+        batch.append(user_game)
+        if len(batch) == batch_size:
+            await write(batch)
+            batch = []
+    if batch:
+        await write(batch)
+    return counts
+
+async def verify() -> tuple:
+    """
+    Count the sessions in both layouts
+
+    Returns:
+        tuple: (flat documents, sessions in buckets)
+    """
+    db = get_database()
+    flat_count = await db["UserGames"].count_documents({})
+    rows = await db["UserGameBuckets"].aggregate([
+        {"$group": {"_id": None, "sessions": {"$sum": "$count"}}},
+    ]).to_list(length=None)
+    return flat_count, rows[0]["sessions"] if rows else 0
+
+async def main(batch_size: int, only_verify: bool) -> None:
+    if not only_verify:
+        counts = await migrate(batch_size)
+        print(f"copied {counts['copied']}, already copied {counts['skipped']}, failed {counts['failed']}")
+    flat_count, bucketed_count = await verify()
+    print(f"UserGames: {flat_count} documents, UserGameBuckets: {bucketed_count} sessions")
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Copy UserGames into UserGameBuckets")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--verify", action="store_true", help="only compare the counts")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.verify))
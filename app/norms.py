@@ -0,0 +1,367 @@
+import argparse
+import asyncio
+import importlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+from pymongo import DESCENDING
+from pymongo.errors import DuplicateKeyError
+from .database import Repository, get_database, user_games_repository
+
+################################# NORMS #################################
+"""
+Norm-referenced scores.
+
+A batch job reads every played game and computes the distribution of
+the scores of each game and cohort. It writes them as a norm table
+version to `NormTables`:
+
+    {_id: version, created_at, sessions, bins, tables: [
+        {game_id, cohort, count, mean, std, min, max, low, high, histogram}
+    ]}
+
+    python -m app.norms --workers 4 --batch-size 100000
+
+The job streams the sessions, summarizes each batch in a process pool
+(count, mean, sum of squared deviations and a fixed-bin histogram per
+group, merged as they come back), so its memory does not depend on the
+number of sessions. Histogram bins span the score range of each game,
+read first with one aggregation.
+
+Workers load the latest version at start and when the invalidation bus
+reports a new one. A new session is then scored with a dict lookup and
+a little arithmetic: its `z_score` against its cohort and its
+`percentile` (share of the sessions with a lower score, 0 to 100,
+interpolated within the histogram bin).
+
+Cohorts: every user belongs to the `all` cohort. To get per-cohort
+tables, e.g. by age band, name a function mapping a user document to a
+cohort in `NORMS_COHORT_FUNCTION`, for the job and the workers alike.
+Sessions are also counted in `all`, which is used when the user's
+cohort has no table.
+"""
+
+DEFAULT_COHORT = "all"
+
+def default_cohort(user: dict) -> str:
+    return DEFAULT_COHORT
+
+_cohort_function = None
+
+def cohort_function_from_env():
+    """
+    Get the cohort function named by `NORMS_COHORT_FUNCTION`
+
+    Settings:
+        - `NORMS_COHORT_FUNCTION`: `module:function`, e.g.
+          `myproject.cohorts:age_band` (default: everyone in `all`)
+
+    Returns:
+        The function
+    """
+    path = os.getenv("NORMS_COHORT_FUNCTION")
+    if not path:
+        return default_cohort
+    module_name, _, name = path.partition(":")
+    return getattr(importlib.import_module(module_name), name)
+
+def set_cohort_function(function) -> None:
+    """
+    Set how users are split in cohorts, in place of `NORMS_COHORT_FUNCTION`
+
+    Args:
+        function: Called with a user document, returns the cohort name
+    """
+    global _cohort_function
+    _cohort_function = function
+
+def get_cohort_function():
+    global _cohort_function
+    if _cohort_function is None:
+        _cohort_function = cohort_function_from_env()
+    return _cohort_function
+
+def cohort_of(user: dict) -> str:
+    return get_cohort_function()(user)
+
+# Distributions
+
+def summarize(scores: np.ndarray, low: float, high: float, bins: int) -> tuple:
+    """
+    Summarize a batch of scores, runs in the process pool
+
+    Returns:
+        tuple: `(count, mean, m2, min, max, histogram)`, `m2` being the
+            sum of squared deviations from the mean
+    """
+    mean = float(scores.mean())
+    histogram, _ = np.histogram(np.clip(scores, low, high), bins=bins, range=(low, high))
+    return (
+        int(scores.size),
+        mean,
+        float(np.square(scores - mean).sum()),
+        float(scores.min()),
+        float(scores.max()),
+        histogram,
+    )
+
+class Distribution:
+    """Scores of a game and cohort, merged from batch summaries"""
+
+    def __init__(self, bins: int):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.histogram = np.zeros(bins, dtype=np.int64)
+
+    def merge(self, summary: tuple) -> None:
+        count, mean, m2, low, high, histogram = summary
+        total = self.count + count
+        delta = mean - self.mean
+        # parallel variance (Chan et al.)
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.mean += delta * count / total
+        self.count = total
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+        self.histogram += histogram
+
+    def table(self, game_id: int, cohort: str, low: float, high: float) -> dict:
+        return {
+            "game_id": game_id,
+            "cohort": cohort,
+            "count": self.count,
+            "mean": self.mean,
+            "std": (self.m2 / self.count) ** 0.5,
+            "min": self.min,
+            "max": self.max,
+            "low": low,
+            "high": high,
+            "histogram": self.histogram.tolist(),
+        }
+
+class NormTable:
+    """In-memory norm table of a game and cohort"""
+
+    __slots__ = ("count", "mean", "std", "low", "width", "histogram", "below")
+
+    def __init__(self, table: dict):
+        self.count = table["count"]
+        self.mean = table["mean"]
+        self.std = table["std"]
+        self.low = table["low"]
+        self.histogram = table["histogram"]
+        self.width = (table["high"] - table["low"]) / len(self.histogram)
+        # sessions below each bin
+        self.below = [0]
+        for count in self.histogram[:-1]:
+            self.below.append(self.below[-1] + count)
+
+    def z_score(self, score: float) -> float | None:
+        if self.std == 0:
+            return None
+        return (score - self.mean) / self.std
+
+    def percentile(self, score: float) -> float:
+        position = (score - self.low) / self.width
+        index = min(max(int(position), 0), len(self.histogram) - 1)
+        within = min(max(position - index, 0.0), 1.0)
+        return 100 * (self.below[index] + within * self.histogram[index]) / self.count
+
+################################# REPOSITORY #################################
+
+class NormsRepository(Repository):
+    collection_name = "NormTables"
+
+    async def latest(self) -> dict | None:
+        """
+        Returns:
+            dict: The latest norm table version, None if the job never ran
+        """
+        return await self.collection.find_one({}, sort=[("_id", DESCENDING)])
+
+    async def insert(self, tables: list, sessions: int, bins: int) -> int:
+        """
+        Store a new norm table version
+
+        Args:
+            tables (list): One table per game and cohort
+            sessions (int): Number of sessions read by the job
+            bins (int): Histogram bins per table
+
+        Returns:
+            int: The version
+        """
+        while True:
+            latest = await self.latest()
+            version = latest["_id"] + 1 if latest is not None else 1
+            try:
+                await self.collection.insert_one({
+                    "_id": version,
+                    "created_at": datetime.now(timezone.utc),
+                    "sessions": sessions,
+                    "bins": bins,
+                    "tables": tables,
+                })
+                return version
+            except DuplicateKeyError:
+                # another job stored the same version first
+                continue
+
+class NormIndex:
+    """Norm tables of the latest version, by game and cohort"""
+
+    def __init__(self):
+        self.repository = NormsRepository()
+        self.version = None
+        self.tables = {}
+
+    async def load(self) -> None:
+        """Load the latest version, keeps the current one if there is none"""
+        document = await self.repository.latest()
+        if document is None:
+            return
+        self.tables = {(table["game_id"], table["cohort"]): NormTable(table) for table in document["tables"]}
+        self.version = document["_id"]
+
+    def get(self, game_id: int, user: dict) -> NormTable | None:
+        """
+        Get the table to score a session against
+
+        Args:
+            game_id (int): The game id
+            user (dict): The user who played
+
+        Returns:
+            NormTable: The table of the user's cohort, or of `all` when
+                the cohort has none, None without a table for the game
+        """
+        table = self.tables.get((game_id, cohort_of(user)))
+        if table is None:
+            table = self.tables.get((game_id, DEFAULT_COHORT))
+        return table
+
+    def score(self, game_id: int, user: dict, score: float) -> dict:
+        """
+        Score a session against the norms
+
+        Returns:
+            dict: `z_score`, `percentile` and `norm_version`, None without a table
+        """
+        table = self.get(game_id, user)
+        if table is None:
+            return {"z_score": None, "percentile": None, "norm_version": None}
+        return {"z_score": table.z_score(score), "percentile": table.percentile(score), "norm_version": self.version}
+
+norms = NormIndex()
+
+################################# BATCH JOB #################################
+
+async def _score_ranges() -> dict:
+    rows = await user_games_repository.aggregate(
+        {}, [{"$group": {"_id": "$game_id", "low": {"$min": "$score"}, "high": {"$max": "$score"}}}],
+        allowDiskUse=True,
+    ).to_list(length=None)
+    ranges = {}
+    for row in rows:
+        low, high = float(row["low"]), float(row["high"])
+        ranges[row["_id"]] = (low, high if high > low else low + 1)
+    return ranges
+
+async def _user_cohorts() -> dict:
+    return {user["id"]: cohort_of(user) async for user in get_database()["Users"].find({}, {"password": 0})}
+
+async def compute(batch_size: int = 100000, workers: int | None = None, bins: int = 200, min_count: int = 30) -> tuple:
+    """
+    Compute the norm tables from every played game
+
+    Args:
+        batch_size (int): Sessions read before they are summarized
+        workers (int): Processes of the pool, defaults to the cpu count, 0 runs inline
+        bins (int): Histogram bins per table
+        min_count (int): Tables with fewer sessions are left out
+
+    Returns:
+        tuple: (tables, sessions read)
+    """
+    ranges = await _score_ranges()
+    cohorts = None if get_cohort_function() is default_cohort else await _user_cohorts()
+    if workers is None:
+        workers = os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+    loop = asyncio.get_running_loop()
+    distributions = {}
+    running = set()
+    sessions = 0
+
+    async def summarize_group(key: tuple, scores: np.ndarray) -> None:
+        low, high = ranges[key[0]]
+        if pool is None:
+            summary = summarize(scores, low, high, bins)
+        else:
+            summary = await loop.run_in_executor(pool, summarize, scores, low, high, bins)
+        if key not in distributions:
+            distributions[key] = Distribution(bins)
+        distributions[key].merge(summary)
+
+    async def submit(groups: dict) -> None:
+        for key, scores in groups.items():
+            # keeps at most two batches per worker in flight
+            while len(running) >= 2 * max(workers, 1):
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    running.discard(task)
+                    task.result()
+            running.add(asyncio.create_task(summarize_group(key, np.array(scores, dtype=np.float64))))
+
+    try:
+        groups = {}
+        count = 0
+        async for session in user_games_repository.iter_sessions(batch_size=min(batch_size, 10000)):
+            game_id = session["game_id"]
+            if game_id not in ranges:
+                # stored after the ranges were read
+                continue
+            groups.setdefault((game_id, DEFAULT_COHORT), []).append(session["score"])
+            if cohorts is not None:
+                cohort = cohorts.get(session["user_id"], DEFAULT_COHORT)
+                if cohort != DEFAULT_COHORT:
+                    groups.setdefault((game_id, cohort), []).append(session["score"])
+            count += 1
+            if count == batch_size:
+                await submit(groups)
+                sessions += count
+                groups = {}
+                count = 0
+        await submit(groups)
+        sessions += count
+        if running:
+            await asyncio.gather(*running)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    tables = [
+        distribution.table(game_id, cohort, *ranges[game_id])
+        for (game_id, cohort), distribution in sorted(distributions.items())
+        if distribution.count >= min_count
+    ]
+    return tables, sessions
+
+async def main(batch_size: int, workers: int | None, bins: int, min_count: int) -> None:
+    tables, sessions = await compute(batch_size, workers, bins, min_count)
+    version = await norms.repository.insert(tables, sessions, bins)
+    print(f"Norm tables version {version}: {len(tables)} tables from {sessions} sessions")
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Compute the norm tables from UserGames")
+    parser.add_argument("--batch-size", type=int, default=100000, help="sessions per summarized batch")
+    parser.add_argument("--workers", type=int, default=None, help="processes, 0 runs inline (default cpu count)")
+    parser.add_argument("--bins", type=int, default=200, help="histogram bins per table")
+    parser.add_argument("--min-count", type=int, default=30, help="smallest table stored")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.workers, args.bins, args.min_count))
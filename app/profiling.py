@@ -0,0 +1,221 @@
+import cProfile
+import hmac
+import io
+import itertools
+import marshal
+import os
+import pstats
+import time
+from collections import deque
+from contextvars import ContextVar
+from urllib.parse import parse_qs
+from pymongo import monitoring
+
+################################# PROFILING #################################
+"""
+Opt-in profiling of single requests, for staging.
+
+A request is profiled when it carries `X-Profile: 1` (or `?profile=1`)
+together with `X-Admin-Token` matching `ADMIN_TOKEN`. Profiling is off
+when `ADMIN_TOKEN` is not set.
+
+The request runs under `cProfile` and every MongoDB command it issues is
+recorded. The result is kept in a ring buffer of the last
+`PROFILE_RING_SIZE` profiles (default 20) and its id is returned in the
+`X-Profile-Id` response header.
+
+cProfile sees the whole event loop thread, so requests running at the
+same time show up in the call graph. MongoDB commands are attributed
+exactly, through a context variable that Motor copies to its threads.
+Only one request is profiled at a time.
+"""
+
+current_profile = ContextVar("current_profile", default=None)
+
+class RequestProfile:
+    """Profile of one request"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, method: str, path: str):
+        self.id = next(self._ids)
+        self.method = method
+        self.path = path
+        self.status = None
+        self.started_at = time.time()
+        self.duration_ms = 0.0
+        self.mongo_calls = []
+        self.stats = None
+        self._collections = {}
+
+    def record_mongo_call(self, collection: str, command: str, duration_ms: float, outcome: str) -> None:
+        self.mongo_calls.append({
+            "collection": collection,
+            "command": command,
+            "duration_ms": duration_ms,
+            "outcome": outcome,
+        })
+
+    def mongo_summary(self) -> list:
+        """
+        Returns:
+            list: Calls, total and max milliseconds per collection and command, slowest first
+        """
+        groups = {}
+        for call in self.mongo_calls:
+            key = (call["collection"], call["command"])
+            group = groups.setdefault(key, {"collection": key[0], "command": key[1], "calls": 0, "total_ms": 0.0, "max_ms": 0.0})
+            group["calls"] += 1
+            group["total_ms"] += call["duration_ms"]
+            group["max_ms"] = max(group["max_ms"], call["duration_ms"])
+        return sorted(groups.values(), key=lambda group: group["total_ms"], reverse=True)
+
+    def report(self, limit: int = 40) -> str:
+        """
+        Returns:
+            str: The functions with the highest cumulative time
+        """
+        buffer = io.StringIO()
+        stats = pstats.Stats(_StatsHolder(self.stats), stream=buffer)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return buffer.getvalue()
+
+    def dump(self) -> bytes:
+        """
+        Returns:
+            bytes: The profile in the format of `cProfile.Profile.dump_stats`,
+                readable with `pstats` or snakeviz
+        """
+        return marshal.dumps(self.stats)
+
+    def summary(self) -> dict:
+        mongo_ms = sum(call["duration_ms"] for call in self.mongo_calls)
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "mongo_calls": len(self.mongo_calls),
+            "mongo_ms": mongo_ms,
+            "mongo": self.mongo_summary(),
+        }
+
+class _StatsHolder:
+    """What `pstats.Stats` expects from a profiler"""
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+profiles = deque(maxlen=int(os.getenv("PROFILE_RING_SIZE", "20")))
+
+def load_settings() -> None:
+    """Read `PROFILE_RING_SIZE` from the environment again, keeping the newest profiles"""
+    global profiles
+    profiles = deque(profiles, maxlen=int(os.getenv("PROFILE_RING_SIZE", "20")))
+
+def get_profile(profile_id: int) -> RequestProfile | None:
+    """
+    Get a profile from the ring buffer
+
+    Args:
+        profile_id (int): The id from the `X-Profile-Id` header
+
+    Returns:
+        RequestProfile: The profile or None if it was dropped
+    """
+    for profile in profiles:
+        if profile.id == profile_id:
+            return profile
+    return None
+
+def is_admin_token(token: str | None) -> bool:
+    """
+    Check a token against `ADMIN_TOKEN`
+
+    Args:
+        token (str): The token sent by the client
+
+    Returns:
+        bool: False when `ADMIN_TOKEN` is not set
+    """
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token or not token:
+        return False
+    return hmac.compare_digest(token.encode(), admin_token.encode())
+
+################################# MIDDLEWARE #################################
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the requests that ask for it"""
+
+    def __init__(self, app):
+        self.app = app
+        self._busy = False
+
+    def _wants_profile(self, scope) -> bool:
+        headers = dict(scope["headers"])
+        flag = headers.get(b"x-profile", b"").decode()
+        if not flag:
+            flag = parse_qs(scope.get("query_string", b"").decode()).get("profile", [""])[0]
+        if flag not in ("1", "true"):
+            return False
+        return is_admin_token(headers.get(b"x-admin-token", b"").decode() or None)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._busy or not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        profile = RequestProfile(scope["method"], scope["path"])
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", str(profile.id).encode())
+                ]
+            await send(message)
+
+        self._busy = True
+        token = current_profile.set(profile)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.disable()
+            profile.duration_ms = (time.perf_counter() - start) * 1000
+            current_profile.reset(token)
+            self._busy = False
+            profiler.create_stats()
+            profile.stats = profiler.stats
+            profiles.append(profile)
+
+################################# MONGODB #################################
+
+class ProfileCommandListener(monitoring.CommandListener):
+    """Attribute MongoDB commands to the request being profiled"""
+
+    def started(self, event):
+        profile = current_profile.get()
+        if profile is not None:
+            collection = event.command.get(event.command_name)
+            profile._collections[event.request_id] = collection if isinstance(collection, str) else ""
+
+    def succeeded(self, event):
+        self._record(event, "success")
+
+    def failed(self, event):
+        self._record(event, "failure")
+
+    def _record(self, event, outcome: str) -> None:
+        profile = current_profile.get()
+        if profile is None:
+            return
+        collection = profile._collections.pop(event.request_id, "")
+        profile.record_mongo_call(collection, event.command_name, event.duration_micros / 1000, outcome)
@@ -0,0 +1,102 @@
+import math
+import time
+from fastapi.exceptions import HTTPException
+from .cache import TTLCache
+from . import metrics
+
+################################# RATE LIMITING #################################
+"""
+Token bucket rate limiting.
+
+Every key (a user id, a client address) has a bucket of `burst` tokens,
+refilled at `rate` tokens per second. A request takes one token, when
+the bucket is empty it is rejected with a 429 and a `Retry-After`
+header telling when the next token is available.
+
+Buckets are kept by a backend. `MemoryRateLimitBackend` keeps them in
+the worker, so with several workers each one enforces its own limit.
+A shared store can be used by implementing `RateLimitBackend.take`.
+"""
+
+class RateLimitBackend:
+    """Storage of the token buckets"""
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """
+        Take a token from a bucket
+
+        Args:
+            key (str): The bucket
+            rate (float): Tokens added per second
+            burst (float): Size of the bucket
+
+        Returns:
+            float: 0 if a token was taken, otherwise the seconds
+                until the next token is available
+        """
+        raise NotImplementedError
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    Buckets in a bounded LRU cache of the worker
+
+    A bucket is dropped once it would be full again, a missing bucket
+    is a full one, so idle clients take no memory.
+
+    Args:
+        maxsize (int): Maximum number of buckets
+    """
+
+    def __init__(self, maxsize: int = 100000):
+        self.buckets = TTLCache(maxsize=maxsize, ttl=0)
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            tokens = burst
+        else:
+            tokens, updated = bucket
+            tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens < 1:
+            self.buckets.set(key, (tokens, now), (burst - tokens) / rate)
+            return (1 - tokens) / rate
+        tokens -= 1
+        self.buckets.set(key, (tokens, now), (burst - tokens) / rate)
+        return 0.0
+
+class RateLimiter:
+    """
+    Args:
+        name (str): Name of the limiter, used in metrics and bucket keys
+        rate (float): Requests per second allowed on average, 0 disables the limiter
+        burst (float): Requests allowed at once
+        backend (RateLimitBackend): Bucket storage, in memory by default
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, backend: RateLimitBackend | None = None):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.backend = backend or MemoryRateLimitBackend()
+
+    async def check(self, key: str) -> None:
+        """
+        Take a token for a key
+
+        Args:
+            key (str): The user id or client address
+
+        Raises:
+            HTTPException: 429 with `Retry-After` if the bucket is empty
+        """
+        if self.rate <= 0:
+            return
+        retry_after = await self.backend.take(f"{self.name}:{key}", self.rate, max(self.burst, 1))
+        if retry_after > 0:
+            metrics.rate_limited_requests.inc(limiter=self.name)
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
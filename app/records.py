@@ -0,0 +1,50 @@
+from dataclasses import dataclass
+from datetime import datetime
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+################################# RECORDS #################################
+"""
+Internal records and the response class of the hot routes.
+
+Pydantic models validate request bodies and describe responses in the
+OpenAPI schema. Data read from MongoDB or built by the server is
+already valid, so hot routes carry it in slotted dataclasses and
+return an `ORJSONResponse` themselves. FastAPI then skips response
+model validation and serialization, and orjson encodes the
+dataclasses natively.
+"""
+
+@dataclass(slots=True)
+class UserGameRecord:
+    """A played game, as returned by the history and score routes"""
+    user_id: str
+    game_id: int
+    score: float
+    date: datetime
+
+@dataclass(slots=True)
+class ScoredGameRecord(UserGameRecord):
+    """A game just stored, with its scores against the norm tables"""
+    z_score: float | None
+    percentile: float | None
+    norm_version: int | None
+
+def encode_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response encoded with orjson
+
+    Serializes dataclasses, datetimes (ISO 8601), numpy arrays and
+    `ObjectId` (as a string) without converting them first.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(
+            content, default=encode_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
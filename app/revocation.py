@@ -0,0 +1,157 @@
+import time
+from datetime import datetime, timezone
+from pymongo import ReturnDocument
+from .database import Repository
+
+################################# REVOCATION #################################
+"""
+Login sessions and their revocation.
+
+Tokens carry a `jti` (their own id) and a `fam` (the id of the login
+session they come from, shared by every token issued from it by
+refresh). Each session is one document of `TokenFamilies`:
+
+    {_id: fam, jti: jti of the current refresh token, revoked: bool, expires_at}
+
+Refreshing swaps `jti` for the one of the new refresh token, in one
+conditional update. A refresh token whose `jti` is not the current one
+was already used: it leaked, and the session is revoked. A TTL index
+deletes the session once its last refresh token has expired, so the
+collection is bounded by the live sessions, not by the refreshes.
+
+Every worker keeps the revoked sessions in a dict (a hash set with
+their expiry), loaded when it starts and kept in sync by the
+invalidation bus, so checking a token is a hash lookup.
+"""
+
+def _timestamp(date: datetime) -> float:
+    if date.tzinfo is None:
+        # MongoDB returns naive UTC datetimes
+        date = date.replace(tzinfo=timezone.utc)
+    return date.timestamp()
+
+def _date(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+class TokenFamilyRepository(Repository):
+    collection_name = "TokenFamilies"
+
+    async def insert(self, fam: str, jti: str, expires_at: float) -> None:
+        """
+        Store a new login session
+
+        Args:
+            fam (str): The session id
+            jti (str): Id of its refresh token
+            expires_at (float): When the refresh token expires, as a timestamp
+        """
+        await self.collection.insert_one({"_id": fam, "jti": jti, "revoked": False, "expires_at": _date(expires_at)})
+
+    async def rotate(self, fam: str, jti: str, new_jti: str, expires_at: float) -> bool:
+        """
+        Replace the refresh token of a session
+
+        Args:
+            fam (str): The session id
+            jti (str): Id of the refresh token presented
+            new_jti (str): Id of the refresh token issued in its place
+            expires_at (float): When the new refresh token expires, as a timestamp
+
+        Returns:
+            bool: False if `jti` is not the current refresh token or the session was revoked
+        """
+        result = await self.collection.update_one(
+            {"_id": fam, "jti": jti, "revoked": False},
+            {"$set": {"jti": new_jti, "expires_at": _date(expires_at)}},
+        )
+        return result.modified_count == 1
+
+    async def revoke(self, fam: str, expires_at: float) -> float:
+        """
+        Revoke a login session
+
+        Args:
+            fam (str): The session id
+            expires_at (float): Expiry to store if the session is unknown, as a timestamp
+
+        Returns:
+            float: When the last token of the session expires, as a timestamp
+        """
+        document = await self.collection.find_one_and_update(
+            {"_id": fam},
+            {"$set": {"revoked": True}, "$setOnInsert": {"expires_at": _date(expires_at)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return _timestamp(document["expires_at"])
+
+    async def list_revoked(self) -> list:
+        """
+        Returns:
+            list: `(fam, expires_at timestamp)` of every revoked session not expired yet
+        """
+        cursor = self.collection.find(
+            {"revoked": True, "expires_at": {"$gt": datetime.now(timezone.utc)}}, {"expires_at": 1}
+        )
+        return [(document["_id"], _timestamp(document["expires_at"])) async for document in cursor]
+
+class RevocationIndex:
+    """In-memory set of the revoked sessions"""
+
+    def __init__(self):
+        self.repository = TokenFamilyRepository()
+        self.revoked = {}
+        self._prune_at = 1024
+
+    def is_revoked(self, payload: dict) -> bool:
+        """
+        Check the claims of a token
+
+        Args:
+            payload (dict): The decoded claims
+
+        Returns:
+            bool: True if its session was revoked
+        """
+        return payload.get("fam") in self.revoked
+
+    def add(self, fam: str, expires_at: float) -> None:
+        """Add a session revoked by another worker"""
+        self.revoked[fam] = expires_at
+        if len(self.revoked) >= self._prune_at:
+            self.prune()
+            self._prune_at = max(1024, 2 * len(self.revoked))
+
+    async def start(self, fam: str, jti: str, expires_at: float) -> None:
+        """Store a new login session, see `TokenFamilyRepository.insert`"""
+        await self.repository.insert(fam, jti, expires_at)
+
+    async def rotate(self, fam: str, jti: str, new_jti: str, expires_at: float) -> bool:
+        """Replace the refresh token of a session, see `TokenFamilyRepository.rotate`"""
+        return await self.repository.rotate(fam, jti, new_jti, expires_at)
+
+    async def revoke(self, fam: str, expires_at: float) -> float:
+        """
+        Revoke a login session
+
+        Args:
+            fam (str): The session id
+            expires_at (float): Expiry to store if the session is unknown, as a timestamp
+
+        Returns:
+            float: When the last token of the session expires, as a timestamp
+        """
+        expires_at = await self.repository.revoke(fam, expires_at)
+        self.add(fam, expires_at)
+        return expires_at
+
+    async def load(self) -> None:
+        """Replace the set with the sessions revoked in MongoDB, dropping the expired ones"""
+        self.revoked = dict(await self.repository.list_revoked())
+
+    def prune(self) -> None:
+        """Drop the sessions whose tokens have all expired"""
+        now = time.time()
+        self.revoked = {fam: expires_at for fam, expires_at in self.revoked.items() if expires_at > now}
+
+revocations = RevocationIndex()
@@ -0,0 +1,161 @@
+import asyncio
+from datetime import datetime, timedelta
+from pymongo import ReplaceOne, UpdateOne
+from .database import Repository, user_games_repository
+
+################################# ROLLUPS #################################
+"""
+Per user, game and day / ISO week summaries of the played games, kept in
+`UserGameRollups` for progress charts:
+
+- `count`, `sum` (mean = sum / count), `best`
+- `last` and `last_date`: the score of the latest session in the period
+
+They are updated by every stored score, so a chart reads one small
+document per period instead of every session.
+"""
+
+GRANULARITIES = ("day", "week")
+
+def period_start(date: datetime, granularity: str) -> datetime:
+    """
+    Get the start of the day or ISO week (Monday) containing a date
+
+    Args:
+        date (datetime): The date
+        granularity (str): `day` or `week`
+
+    Returns:
+        datetime: Midnight at the start of the period
+    """
+    day = datetime(date.year, date.month, date.day)
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+def _writes(user_game: dict) -> list:
+    writes = []
+    for granularity in GRANULARITIES:
+        key = {
+            "user_id": user_game["user_id"],
+            "game_id": user_game["game_id"],
+            "granularity": granularity,
+            "period": period_start(user_game["date"], granularity),
+        }
+        writes.append(UpdateOne(
+            key,
+            {"$inc": {"count": 1, "sum": user_game["score"]}, "$max": {"best": user_game["score"]}},
+            upsert=True,
+        ))
+        # sessions replayed out of order must not replace a later `last`
+        writes.append(UpdateOne(
+            {**key, "$or": [{"last_date": {"$lte": user_game["date"]}}, {"last_date": {"$exists": False}}]},
+            {"$set": {"last": user_game["score"], "last_date": user_game["date"]}},
+        ))
+    return writes
+
+class RollupsRepository(Repository):
+    collection_name = "UserGameRollups"
+
+    async def record_many(self, user_games: list) -> None:
+        """
+        Add stored games to the rollups
+
+        Args:
+            user_games (list): Documents with `user_id`, `game_id`, `score` and `date`
+        """
+        writes = [write for user_game in user_games for write in _writes(user_game)]
+        if writes:
+            await self.collection.bulk_write(writes, ordered=True)
+
+    async def find(
+        self,
+        user_id: str,
+        game_id: int,
+        granularity: str,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+    ) -> list:
+        """
+        Get the rollups of a user in a game, oldest first
+
+        Args:
+            user_id (str): The user id
+            game_id (int): The game id
+            granularity (str): `day` or `week`
+            date_from (datetime): Only periods starting at or after this date
+            date_to (datetime): Only periods starting before this date
+
+        Returns:
+            list: `period`, `count`, `mean`, `best` and `last` of every period
+        """
+        query = {"user_id": user_id, "game_id": game_id, "granularity": granularity}
+        period_range = {}
+        if date_from is not None:
+            period_range["$gte"] = period_start(date_from, granularity)
+        if date_to is not None:
+            period_range["$lt"] = date_to
+        if period_range:
+            query["period"] = period_range
+        cursor = self.collection.find(
+            query, {"_id": 0, "period": 1, "count": 1, "sum": 1, "best": 1, "last": 1}
+        ).sort("period", 1)
+        return [
+            {
+                "period": rollup["period"],
+                "count": rollup["count"],
+                "mean": rollup["sum"] / rollup["count"],
+                "best": rollup["best"],
+                "last": rollup["last"],
+            }
+            async for rollup in cursor
+        ]
+
+    async def rebuild(self, batch_size: int = 1000) -> None:
+        """
+        Recompute every rollup from the played games
+
+        Reads the played games ordered by user, game and date,
+        so only the periods of one user and game are held in memory.
+        """
+        cursor = user_games_repository.iter_sessions(batch_size)
+        current = None
+        periods = {}
+        writes = []
+        async for user_game in cursor:
+            owner = (user_game["user_id"], user_game["game_id"])
+            if owner != current:
+                writes.extend(_replacements(current, periods))
+                current, periods = owner, {}
+            for granularity in GRANULARITIES:
+                key = (granularity, period_start(user_game["date"], granularity))
+                rollup = periods.setdefault(key, {"count": 0, "sum": 0.0, "best": user_game["score"]})
+                rollup["count"] += 1
+                rollup["sum"] += user_game["score"]
+                rollup["best"] = max(rollup["best"], user_game["score"])
+                rollup["last"] = user_game["score"]
+                rollup["last_date"] = user_game["date"]
+            if len(writes) >= batch_size:
+                await self.collection.bulk_write(writes, ordered=False)
+                writes = []
+        writes.extend(_replacements(current, periods))
+        if writes:
+            await self.collection.bulk_write(writes, ordered=False)
+
+def _replacements(owner: tuple | None, periods: dict) -> list:
+    if owner is None:
+        return []
+    user_id, game_id = owner
+    replacements = []
+    for (granularity, period), rollup in periods.items():
+        key = {"user_id": user_id, "game_id": game_id, "granularity": granularity, "period": period}
+        replacements.append(ReplaceOne(key, {**key, **rollup}, upsert=True))
+    return replacements
+
+rollups = RollupsRepository()
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    asyncio.run(rollups.rebuild())
+    print("Rollups rebuilt")
@@ -0,0 +1,146 @@
+from datetime import datetime
+import numpy as np
+from bson import Binary
+from pymongo.errors import BulkWriteError
+from .database import Repository
+
+################################# ROUNDS #################################
+"""
+Per-round data of the played games, kept in `UserGameRounds` for
+research exports:
+
+    {_id, user_id, game_id, date, score, dtypes: {name: dtype}, columns: {name: Binary}}
+
+`_id` is the `_id` of the played game. `columns` are the arrays built
+by the game's `to_arrays` (reaction times, correctness flags, answers),
+each packed as a fixed-width little-endian array in a BSON Binary, and
+`dtypes` their NumPy dtype strings (e.g. `<f8`). A 100 round color
+game takes under 1 KB this way, several KB as nested documents.
+Reads decode the columns without copying with `np.frombuffer`.
+
+Number game answers have a variable length per round: `correct_answer`
+and `user_answer` hold the answers of every round one after the other,
+`correct_length` and `user_length` how many belong to each round.
+"""
+
+def pack_rounds(arrays: dict) -> dict:
+    """
+    Pack per-round arrays
+
+    Args:
+        arrays (dict): NumPy arrays by name, as returned by `GameScorer.to_arrays`
+
+    Returns:
+        dict: `dtypes` and `columns`, to add to a `UserGameRounds` document
+    """
+    dtypes = {}
+    columns = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder("<"))
+        dtypes[name] = array.dtype.str
+        columns[name] = Binary(array.tobytes())
+    return {"dtypes": dtypes, "columns": columns}
+
+def unpack_rounds(document: dict) -> dict:
+    """
+    Decode the columns of a `UserGameRounds` document
+
+    Args:
+        document (dict): The document, with `dtypes` and `columns`
+
+    Returns:
+        dict: Read-only NumPy arrays by name, backed by the document's bytes
+    """
+    arrays = {}
+    for name, data in document["columns"].items():
+        array = np.frombuffer(data, dtype=np.dtype(document["dtypes"][name]))
+        if not array.dtype.isnative:
+            # only on big-endian hosts
+            array = array.astype(array.dtype.newbyteorder("="))
+        arrays[name] = array
+    return arrays
+
+def rounds_document(user_game: dict, packed: dict) -> dict:
+    """
+    Build the `UserGameRounds` document of a stored game
+
+    Args:
+        user_game (dict): The played game, with its `_id`
+        packed (dict): The game's columns, as returned by `pack_rounds`
+
+    Returns:
+        dict: The document
+    """
+    return {
+        "_id": user_game["_id"],
+        "user_id": user_game["user_id"],
+        "game_id": user_game["game_id"],
+        "date": user_game["date"],
+        "score": user_game["score"],
+        **packed,
+    }
+
+class RoundsRepository(Repository):
+    collection_name = "UserGameRounds"
+
+    async def insert_many(self, documents: list) -> None:
+        """
+        Store the rounds of played games, documents already stored are skipped
+
+        Args:
+            documents (list): Documents built by `rounds_document`
+        """
+        if not documents:
+            return
+        try:
+            await self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            failed = [error for error in e.details["writeErrors"] if error["code"] != 11000]
+            if failed:
+                raise
+
+    async def find(
+        self,
+        user_id: str,
+        game_id: int,
+        limit: int,
+        after: tuple | None = None,
+        date_from: datetime | None = None,
+        date_to: datetime | None = None,
+    ) -> list:
+        """
+        Get the rounds of the games played by a user, oldest first
+
+        Pages use the same `(date, _id)` keyset as the played games.
+
+        Args:
+            user_id (str): The user id
+            game_id (int): The game id
+            limit (int): Maximum number of documents
+            after (tuple): `(date, _id)` of the last document of the previous page
+            date_from (datetime): Only games played at or after this date
+            date_to (datetime): Only games played before this date
+
+        Returns:
+            list: The documents, with the packed columns
+        """
+        query = {"user_id": user_id, "game_id": game_id}
+        date_range = {}
+        if date_from is not None:
+            date_range["$gte"] = date_from
+        if date_to is not None:
+            date_range["$lt"] = date_to
+        if date_range:
+            query["date"] = date_range
+        if after is not None:
+            after_date, after_id = after
+            query["$or"] = [
+                {"date": {"$gt": after_date}},
+                {"date": after_date, "_id": {"$gt": after_id}},
+            ]
+        cursor = self.collection.find(
+            query, {"user_id": 0, "game_id": 0}
+        ).sort([("date", 1), ("_id", 1)]).limit(limit)
+        return await cursor.to_list(length=None)
+
+session_rounds = RoundsRepository()
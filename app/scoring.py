@@ -0,0 +1,160 @@
+from enum import Enum
+from itertools import chain
+import numpy as np
+
+################################# SCORING #################################
+"""
+Score equations of the games, shared by the single session endpoints
+and the batch endpoint.
+
+A session's `score_list` is converted to NumPy arrays once
+(`to_arrays`) and scored with vectorized operations (`evaluate`).
+The arrays hold the raw per-round data, they are also what is stored
+by `app.rounds`. Every game type has exactly one entry in `SCORERS`.
+"""
+
+class GameTypes(Enum):
+    color_game = "color_game"
+    memory_game = "memory_game"
+    number_game = "number_game"
+
+def _times(score_list, n: int) -> np.ndarray:
+    return np.fromiter((one_game.time for one_game in score_list), dtype=np.float64, count=n)
+
+# Color game
+
+def color_game_arrays(score_list) -> dict:
+    """
+    Args:
+        score_list (List[GameScoreColor]): The rounds
+
+    Returns:
+        dict: `correct` (bool per round) and `time`
+    """
+    n = len(score_list)
+    correct = np.fromiter(
+        (one_game.userAnswer == one_game.correctAnswer for one_game in score_list), dtype=np.bool_, count=n
+    )
+    return {"correct": correct, "time": _times(score_list, n)}
+
+def color_game_score(correct: np.ndarray, time: np.ndarray) -> float:
+    """
+    score = binary 0 or 1 * 0.8 - (time * 0.2)/ 1000
+    """
+    return float(np.sum(correct * 0.8 - time * 0.2 / 1000)) + 100
+
+# Number game
+
+def number_game_arrays(score_list) -> dict:
+    """
+    Args:
+        score_list (List[GameScoreNumber]): The rounds
+
+    Returns:
+        dict: `correct_answer` and `user_answer` (the answers of every
+            round, flattened), `correct_length` and `user_length`
+            (answers per round) and `time`
+    """
+    n = len(score_list)
+    correct_length = np.fromiter((len(one_game.correctAnswer) for one_game in score_list), dtype=np.int64, count=n)
+    user_length = np.fromiter((len(one_game.userAnswer) for one_game in score_list), dtype=np.int64, count=n)
+    correct_answer = np.fromiter(
+        chain.from_iterable(one_game.correctAnswer for one_game in score_list),
+        dtype=np.int64, count=int(correct_length.sum()),
+    )
+    user_answer = np.fromiter(
+        chain.from_iterable(one_game.userAnswer for one_game in score_list),
+        dtype=np.int64, count=int(user_length.sum()),
+    )
+    return {
+        "correct_answer": correct_answer,
+        "user_answer": user_answer,
+        "correct_length": correct_length,
+        "user_length": user_length,
+        "time": _times(score_list, n),
+    }
+
+def number_game_matches(
+    correct_answer: np.ndarray, user_answer: np.ndarray, correct_length: np.ndarray, user_length: np.ndarray
+) -> np.ndarray:
+    """
+    Returns:
+        np.ndarray: Number of answers equal to the expected one, per round
+    """
+    n = correct_length.size
+    # answers are compared position by position up to the shorter list
+    compared = np.minimum(correct_length, user_length)
+    rounds = np.repeat(np.arange(n), compared)
+    position = np.arange(rounds.size) - np.repeat(np.cumsum(compared) - compared, compared)
+    correct_index = np.repeat(np.cumsum(correct_length) - correct_length, compared) + position
+    user_index = np.repeat(np.cumsum(user_length) - user_length, compared) + position
+    return np.bincount(rounds, weights=correct_answer[correct_index] == user_answer[user_index], minlength=n)
+
+def number_game_score(
+    correct_answer: np.ndarray,
+    user_answer: np.ndarray,
+    correct_length: np.ndarray,
+    user_length: np.ndarray,
+    time: np.ndarray,
+) -> float:
+    """
+    score = corelation between correct and user matches * 0.8 - (time * 0.2)/ 1000
+    """
+    matches = number_game_matches(correct_answer, user_answer, correct_length, user_length)
+    correlation = matches / correct_length
+    return float(np.sum(correlation * 0.8 - time * 0.2 / 1000)) + 100
+
+# Memory game
+
+def memory_game_arrays(score_list) -> dict:
+    """
+    Args:
+        score_list (List[MemoryGameInput]): The rounds
+
+    Returns:
+        dict: `wrong_matches` and `time`
+    """
+    n = len(score_list)
+    wrong_matches = np.fromiter((one_game.wrongMatches for one_game in score_list), dtype=np.int64, count=n)
+    return {"wrong_matches": wrong_matches, "time": _times(score_list, n)}
+
+def memory_game_score(wrong_matches: np.ndarray, time: np.ndarray) -> float:
+    """
+    score = - wrongMatches * 0.8 - time * 0.2 / 1000
+    """
+    return float(np.sum(- wrong_matches * 0.8 - time * 0.2 / 1000)) + 100
+
+################################# REGISTRY #################################
+
+class GameScorer:
+    """
+    Registry entry of a game type
+
+    Args:
+        game_id (int): The id of the game in the `Games` collection
+        to_arrays: Converts a `score_list` to a dict of arrays
+        evaluate: Computes the final score from those arrays
+    """
+
+    def __init__(self, game_id: int, to_arrays, evaluate):
+        self.game_id = game_id
+        self.to_arrays = to_arrays
+        self.evaluate = evaluate
+
+    def score(self, score_list) -> float:
+        """
+        Score a session
+
+        Args:
+            score_list (list): The rounds of the session
+
+        Returns:
+            float: The final score
+        """
+        return self.evaluate(**self.to_arrays(score_list))
+
+SCORERS = {
+    GameTypes.memory_game: GameScorer(1, memory_game_arrays, memory_game_score),
+    GameTypes.color_game: GameScorer(2, color_game_arrays, color_game_score),
+    GameTypes.number_game: GameScorer(3, number_game_arrays, number_game_score),
+}
@@ -0,0 +1,46 @@
+import argparse
+import os
+import sys
+import uvicorn
+
+################################# SERVER #################################
+"""
+Run the API with one or more worker processes
+
+    python -m app.serve --workers 4 --host 0.0.0.0 --port 8000
+
+With more than one worker the in-memory state of the workers (game
+catalog, token cache, rankings) is kept consistent by the invalidation
+bus, `INVALIDATION_BUS` defaults to `mongo` here (see `app.bus`), or
+`socket` for workers of one host without a replica set.
+The same settings apply under gunicorn:
+
+    INVALIDATION_BUS=mongo gunicorn app.main:app -k uvicorn.workers.UvicornWorker -w 4
+
+Rate limits are enforced by each worker on its own, the effective limit
+is the configured one times the number of workers. Write-behind mode
+needs a single worker, the workers would replay each other's journal.
+"""
+
+def main(argv: list | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the CognitiveGames API")
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--proxy-headers", action="store_true", help="trust X-Forwarded-For from the proxy")
+    args = parser.parse_args(argv)
+    if args.workers > 1:
+        if os.getenv("WRITE_BEHIND", "0") == "1":
+            sys.exit("WRITE_BEHIND=1 needs a single worker")
+        # inherited by the worker processes
+        os.environ.setdefault("INVALIDATION_BUS", "mongo")
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        proxy_headers=args.proxy_headers,
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import asyncio
+from . import metrics
+
+################################# SINGLE FLIGHT #################################
+"""
+Coalescing of identical concurrent reads.
+
+While a computation for a key is running, callers asking for the same
+key wait for it instead of starting their own, and all get its result
+or its exception. Nothing is cached: the next call after it finished
+computes again.
+
+The first caller runs the computation itself, without a task of its
+own, so a call that is not shared costs one dict lookup and a future.
+"""
+
+class SingleFlight:
+    """
+    Args:
+        name (str): Name used in metrics
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+
+    async def do(self, key, function, *args):
+        """
+        Run `function(*args)` unless a call with the same key is in flight
+
+        Args:
+            key: Hashable key identifying the computation
+            function: Coroutine function
+            *args: Its arguments
+
+        Returns:
+            The result of the computation
+        """
+        while key in self._calls:
+            future = self._calls[key]
+            metrics.coalesced_requests.inc(flight=self.name)
+            try:
+                # a waiter going away (client disconnect) must not cancel the others
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # the caller running the computation went away, run it again
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await function(*args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # retrieved here, there may be no waiter to retrieve it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    def __len__(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,219 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pydantic import BaseModel
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from .database import Repository, get_database, user_games_repository
+
+################################# MODELS #################################
+
+class ScoreStatistics(BaseModel):
+    count: int = 0
+    sum: float = 0.0
+    sum_sq: float = 0.0
+    min: float | None = None
+    max: float | None = None
+
+    @property
+    def mean(self) -> float | None:
+        if self.count == 0:
+            return None
+        return self.sum / self.count
+
+    @property
+    def variance(self) -> float | None:
+        if self.count == 0:
+            return None
+        mean = self.sum / self.count
+        return max(self.sum_sq / self.count - mean * mean, 0.0)
+
+################################# REPOSITORY #################################
+"""
+Running statistics are kept in two small collections:
+
+- `GameStatistics`: one document per game
+- `UserGameStatistics`: one document per user and game
+
+Both are updated with a single upsert per score, so reading an average
+is one indexed `find_one` regardless of how many scores were stored.
+
+Scores stored before the statistics were maintained are counted by a
+backfill, run once per deployment by the first worker that starts
+(`backfill`), and recorded as done in `Migrations`. Scores stored by
+other workers while it runs may be missed or counted twice. Run it
+during a maintenance window with `python -m app.statistics` to avoid
+that, the workers then skip it.
+"""
+
+BACKFILL_ID = "statistics_backfill"
+
+def _update(score: float) -> dict:
+    return {
+        "$inc": {"count": 1, "sum": score, "sum_sq": score * score},
+        "$min": {"min": score},
+        "$max": {"max": score},
+    }
+
+def _group_stages(key: dict) -> list:
+    return [
+        {"$group": {
+            "_id": key,
+            "count": {"$sum": 1},
+            "sum": {"$sum": "$score"},
+            "sum_sq": {"$sum": {"$multiply": ["$score", "$score"]}},
+            "min": {"$min": "$score"},
+            "max": {"$max": "$score"},
+        }},
+    ]
+
+class ScoreStatisticsRepository(Repository):
+    collection_name = "GameStatistics"
+    user_collection_name = "UserGameStatistics"
+
+    @property
+    def user_collection(self):
+        return get_database()[self.user_collection_name]
+
+    async def record(self, user_id: str, game_id: int, score: float) -> None:
+        """
+        Add one score to the game and user statistics
+
+        Args:
+            user_id (str): The user id
+            game_id (int): The game id
+            score (float): The score
+        """
+        update = _update(score)
+        await asyncio.gather(
+            self.collection.update_one({"game_id": game_id}, update, upsert=True),
+            self.user_collection.update_one({"user_id": user_id, "game_id": game_id}, update, upsert=True),
+        )
+
+    async def record_many(self, user_games: list) -> None:
+        """
+        Add many scores to the game and user statistics
+
+        Args:
+            user_games (list): Documents with `user_id`, `game_id` and `score`
+        """
+        if not user_games:
+            return
+        game_writes = []
+        user_writes = []
+        for user_game in user_games:
+            update = _update(user_game["score"])
+            game_writes.append(UpdateOne({"game_id": user_game["game_id"]}, update, upsert=True))
+            user_writes.append(UpdateOne(
+                {"user_id": user_game["user_id"], "game_id": user_game["game_id"]}, update, upsert=True
+            ))
+        await asyncio.gather(
+            self.collection.bulk_write(game_writes, ordered=False),
+            self.user_collection.bulk_write(user_writes, ordered=False),
+        )
+
+    async def get(self, game_id: int, user_id: str | None = None) -> ScoreStatistics | None:
+        """
+        Get the statistics of a game, or of one user in a game
+
+        Args:
+            game_id (int): The game id
+            user_id (str): The user id
+
+        Returns:
+            ScoreStatistics: The statistics or None if nothing was recorded
+        """
+        if user_id is None:
+            document = await self.collection.find_one({"game_id": game_id}, {"_id": 0})
+        else:
+            document = await self.user_collection.find_one({"user_id": user_id, "game_id": game_id}, {"_id": 0})
+        if document is None:
+            return None
+        return ScoreStatistics(**document)
+
+    async def rebuild(self, game_id: int | None = None) -> None:
+        """
+        Recompute the statistics from the played games with a `$group` pipeline
+
+        Used to backfill the statistics for scores stored before they
+        were maintained, or to repair them.
+
+        Args:
+            game_id (int): Only rebuild this game, all games if None
+        """
+        match = {} if game_id is None else {"game_id": game_id}
+        await _replace_rows(
+            self.collection,
+            user_games_repository.aggregate(match, _group_stages({"game_id": "$game_id"}), allowDiskUse=True),
+        )
+        await _replace_rows(
+            self.user_collection,
+            user_games_repository.aggregate(
+                match, _group_stages({"user_id": "$user_id", "game_id": "$game_id"}), allowDiskUse=True
+            ),
+        )
+
+    @property
+    def migrations(self):
+        return get_database()["Migrations"]
+
+    async def backfill(self, lease: timedelta = timedelta(hours=1)) -> bool:
+        """
+        Rebuild the statistics unless it was done before in this deployment
+
+        The first caller claims the backfill in `Migrations`, other
+        callers skip it while it runs. A claim older than `lease`
+        (a worker that died while rebuilding) is taken over.
+
+        Args:
+            lease (timedelta): How long a claim holds
+
+        Returns:
+            bool: True if this call rebuilt the statistics
+        """
+        now = datetime.now(timezone.utc)
+        try:
+            await self.migrations.update_one(
+                {
+                    "_id": BACKFILL_ID,
+                    "done_at": {"$exists": False},
+                    "$or": [{"started_at": {"$exists": False}}, {"started_at": {"$lt": now - lease}}],
+                },
+                {"$set": {"started_at": now}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # done, or running in another worker
+            return False
+        await self.rebuild()
+        await self.mark_backfilled()
+        return True
+
+    async def mark_backfilled(self) -> None:
+        """Record the backfill as done"""
+        await self.migrations.update_one(
+            {"_id": BACKFILL_ID}, {"$set": {"done_at": datetime.now(timezone.utc)}}, upsert=True
+        )
+
+async def _replace_rows(collection, rows, batch_size: int = 1000) -> None:
+    writes = []
+    async for row in rows:
+        key = row.pop("_id")
+        writes.append(ReplaceOne(key, {**key, **row}, upsert=True))
+        if len(writes) == batch_size:
+            await collection.bulk_write(writes, ordered=False)
+            writes = []
+    if writes:
+        await collection.bulk_write(writes, ordered=False)
+
+score_statistics = ScoreStatisticsRepository()
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    async def main():
+        await score_statistics.rebuild()
+        await score_statistics.mark_backfilled()
+
+    asyncio.run(main())
+    print("Statistics rebuilt")
@@ -0,0 +1,86 @@
+"""
+Concurrency benchmark for the MongoDB access layer
+
+Compares requests/sec of a score submission route that calls the blocking
+`pymongo` driver inside `async def` (the previous implementation) with the
+same route going through the async repositories in `app.database`.
+
+Needs a reachable MongoDB, the benchmark writes into a throwaway database.
+
+Usage:
+    BENCH_MONGO_URI=mongodb://localhost:27017 python -m benchmarks.async_driver --requests 2000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+import httpx
+from fastapi import FastAPI
+from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from app import database
+
+BENCH_DB_NAME = "CognitiveBenchmark"
+
+def build_blocking_app(uri: str) -> FastAPI:
+    """Route calling the synchronous driver on the event loop thread"""
+    bench_app = FastAPI()
+    collection = MongoClient(uri)[BENCH_DB_NAME]["UserGames"]
+
+    @bench_app.post("/score")
+    async def add_score():
+        result = collection.insert_one({"user_id": "bench", "game_id": 1, "score": 100.0, "date": datetime.now()})
+        return {"id": str(result.inserted_id)}
+
+    return bench_app
+
+def build_async_app(uri: str) -> FastAPI:
+    """Route awaiting the async repository"""
+    bench_app = FastAPI()
+    database.set_client(AsyncIOMotorClient(uri, **database.get_client_options()))
+
+    @bench_app.post("/score")
+    async def add_score():
+        inserted_id = await database.user_games_repository.insert(
+            {"user_id": "bench", "game_id": 1, "score": 100.0, "date": datetime.now()}
+        )
+        return {"id": str(inserted_id)}
+
+    return bench_app
+
+async def drive(bench_app: FastAPI, requests: int, concurrency: int) -> float:
+    """
+    Send `requests` POSTs with `concurrency` requests in flight
+
+    Returns:
+        float: Requests per second
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=bench_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as bench_client:
+        async def one():
+            async with semaphore:
+                response = await bench_client.post("/score")
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        return requests / (time.perf_counter() - start)
+
+async def main(uri: str, requests: int, concurrency: int) -> None:
+    os.environ["MONGO_DB_NAME"] = BENCH_DB_NAME
+    blocking_rps = await drive(build_blocking_app(uri), requests, concurrency)
+    async_rps = await drive(build_async_app(uri), requests, concurrency)
+    print(f"blocking pymongo : {blocking_rps:10.1f} req/s")
+    print(f"async repository : {async_rps:10.1f} req/s")
+    MongoClient(uri).drop_database(BENCH_DB_NAME)
+    database.close_client()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uri", default=os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.uri, args.requests, args.concurrency))
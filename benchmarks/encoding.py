@@ -0,0 +1,79 @@
+"""
+Response encoding benchmark
+
+Encodes histories of played games the way `/users/games/{game_id}`
+sends them, as JSON or MessagePack, uncompressed, gzip or brotli
+compressed (`app.encoding`), and reports the bytes on the wire and the
+server CPU time per response. Checks that every encoding decodes to
+the same rows.
+
+Usage:
+    python -m benchmarks.encoding --rows 1000 100000 --repeat 5
+"""
+import argparse
+import gzip
+import random
+import time
+from datetime import datetime, timedelta
+import brotli
+import orjson
+import ormsgpack
+from app import encoding
+from app.records import UserGameRecord
+
+def make_records(count: int) -> list:
+    rng = random.Random(0)
+    start = datetime(2024, 1, 1)
+    return [
+        UserGameRecord(
+            "00000000-0000-0000-0000-000000000000",
+            2,
+            rng.uniform(-10, 100),
+            start + timedelta(minutes=index, milliseconds=rng.randint(0, 999)),
+        )
+        for index in range(count)
+    ]
+
+DECODERS = {
+    encoding.JSON: orjson.loads,
+    encoding.MSGPACK: ormsgpack.unpackb,
+}
+
+DECOMPRESSORS = {
+    None: lambda body: body,
+    "gzip": gzip.decompress,
+    "br": brotli.decompress,
+}
+
+def encode(records: list, media: str, coding: str | None) -> bytes:
+    return encoding.compress(encoding.serialize(records, media), coding)
+
+def measure(records: list, media: str, coding: str | None, repeat: int) -> tuple:
+    """
+    Returns:
+        tuple: (body size in bytes, best CPU time in ms)
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        body = encode(records, media, coding)
+        best = min(best, time.process_time() - start)
+    return len(body), best * 1000
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for rows in args.rows:
+        records = make_records(rows)
+        expected = orjson.loads(encoding.serialize(records, encoding.JSON))
+        baseline = None
+        for media in (encoding.JSON, encoding.MSGPACK):
+            for coding in (None, "gzip", "br"):
+                decoded = DECODERS[media](DECOMPRESSORS[coding](encode(records, media, coding)))
+                assert decoded == expected, f"{media} {coding} decodes to other rows"
+                size, cpu = measure(records, media, coding, args.repeat)
+                baseline = baseline or size
+                print(f"{rows:7} rows {media:20} {coding or 'identity':8} "
+                      f"{size:11} bytes ({size / baseline:6.1%}), {cpu:8.2f} ms CPU")
@@ -0,0 +1,53 @@
+"""
+Import-time budget check
+
+Imports `app.main` in fresh interpreters and fails (exit code 1) when
+the median import time is over budget. Importing must not need the
+network or a `.env` file, so the check runs with an empty MongoDB
+configuration.
+
+FastAPI is imported first and timed on its own: the budget applies to
+the import cost of the app itself, which does not depend on the
+installed FastAPI and Pydantic versions.
+
+Usage:
+    python -m benchmarks.import_time --runs 5 --budget 0.5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+MEASURE = (
+    "import time; start = time.perf_counter(); import fastapi; middle = time.perf_counter(); "
+    "import app.main; print(middle - start, time.perf_counter() - middle)"
+)
+
+def measure(runs: int) -> list:
+    """
+    Returns:
+        list: `(fastapi, app.main)` import times in seconds, one per run
+    """
+    env = {key: value for key, value in os.environ.items() if not key.startswith("MONGO_")}
+    env["MONGO_URI"] = "mongodb://unreachable.invalid:27017/?serverSelectionTimeoutMS=1"
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", MEASURE], env=env, capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(tuple(float(value) for value in output.strip().splitlines()[-1].split()))
+    return timings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=float(os.getenv("IMPORT_BUDGET_SECONDS", "0.5")))
+    args = parser.parse_args()
+    timings = measure(args.runs)
+    framework = statistics.median(fastapi for fastapi, _ in timings)
+    app_timings = [app for _, app in timings]
+    median = statistics.median(app_timings)
+    print(f"import fastapi: median {framework * 1000:.0f} ms")
+    print(f"import app.main: median {median * 1000:.0f} ms, max {max(app_timings) * 1000:.0f} ms, budget {args.budget * 1000:.0f} ms")
+    sys.exit(0 if median <= args.budget else 1)
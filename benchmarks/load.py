@@ -0,0 +1,243 @@
+"""
+Load benchmark
+
+Runs the app in-process against `mongomock_motor` and drives it with
+concurrent clients, each one picking requests from a weighted mix of
+login, `/me`, score submissions for the three games, history reads and
+`/do_i_score_below_average`. Reports throughput and p50/p95/p99
+latency per endpoint.
+
+For CI, `--output` writes the results as JSON and `--baseline` compares
+the run with such a file: the exit code is 1 when the p95 latency of an
+endpoint grew by more than `--tolerance` (default 50%) or a request
+failed. Latencies measured in-process include the mongomock overhead,
+compare runs from the same machine only.
+
+Needs the packages of `benchmarks/requirements.txt`:
+
+    pip install -r benchmarks/requirements.txt
+
+Usage:
+    python -m benchmarks.load --users 20 --concurrency 50 --requests 5000
+    python -m benchmarks.load --output load.json
+    python -m benchmarks.load --baseline load.json --tolerance 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("JWT_SECRET", "benchmark-secret-benchmark-secret")
+# all virtual clients share one address, keep the limiters on but out of the way
+os.environ.setdefault("RATE_LIMIT_USER_RATE", "1000000")
+os.environ.setdefault("RATE_LIMIT_IP_RATE", "1000000")
+os.environ.setdefault("RATE_LIMIT_IP_BURST", "1000000")
+
+import httpx
+from mongomock_motor import AsyncMongoMockClient
+from app import database, dependencies
+from app.main import app
+
+GAMES = {1: "memory_game", 2: "color_game", 3: "number_game"}
+COLORS = ["red", "green", "blue", "yellow"]
+PASSWORD = "benchmark"
+
+# Request mix
+
+def color_rounds(rng: random.Random, rounds: int) -> list:
+    return [
+        {"correctAnswer": rng.choice(COLORS), "userAnswer": rng.choice(COLORS), "time": rng.randint(200, 3000)}
+        for _ in range(rounds)
+    ]
+
+def number_rounds(rng: random.Random, rounds: int) -> list:
+    score_list = []
+    for _ in range(rounds):
+        correct = [rng.randint(0, 9) for _ in range(rng.randint(3, 8))]
+        answer = [digit if rng.random() < 0.8 else rng.randint(0, 9) for digit in correct]
+        score_list.append({"correctAnswer": correct, "userAnswer": answer, "time": rng.randint(500, 5000)})
+    return score_list
+
+def memory_rounds(rng: random.Random, rounds: int) -> list:
+    return [{"wrongMatches": rng.randint(0, 10), "time": rng.randint(1000, 20000)} for _ in range(rounds)]
+
+async def login(client: httpx.AsyncClient, user: dict, rng: random.Random) -> httpx.Response:
+    response = await client.post("/login", data={"username": user["username"], "password": PASSWORD})
+    if response.status_code == 200:
+        user["headers"] = {"Authorization": "Bearer " + response.json()["access_token"]}
+    return response
+
+async def me(client: httpx.AsyncClient, user: dict, rng: random.Random) -> httpx.Response:
+    return await client.get("/me", headers=user["headers"])
+
+async def color_game(client: httpx.AsyncClient, user: dict, rng: random.Random) -> httpx.Response:
+    return await client.post(
+        "/add_new_score/color_game", headers=user["headers"], json={"score_list": color_rounds(rng, 20)}
+    )
+
+async def number_game(client: httpx.AsyncClient, user: dict, rng: random.Random) -> httpx.Response:
+    return await client.post(
+        "/add_new_score/number_game", headers=user["headers"], json={"score_list": number_rounds(rng, 10)}
+    )
+
+async def memory_game(client: httpx.AsyncClient, user: dict, rng: random.Random) -> httpx.Response:
+    return await client.post(
+        "/add_new_score/memory_game", headers=user["headers"], json={"score_list": memory_rounds(rng, 5)}
+    )
+
+async def history(client: httpx.AsyncClient, user: dict, rng: random.Random) -> httpx.Response:
+    return await client.get(f"/users/games/{rng.choice(list(GAMES))}", headers=user["headers"])
+
+async def below_average(client: httpx.AsyncClient, user: dict, rng: random.Random) -> httpx.Response:
+    return await client.get(f"/do_i_score_below_average/{rng.choice(list(GAMES))}", headers=user["headers"])
+
+# (name, request, weight)
+MIX = [
+    ("POST /login", login, 2),
+    ("GET /me", me, 20),
+    ("POST /add_new_score/color_game", color_game, 10),
+    ("POST /add_new_score/number_game", number_game, 10),
+    ("POST /add_new_score/memory_game", memory_game, 10),
+    ("GET /users/games/{game_id}", history, 25),
+    ("GET /do_i_score_below_average/{game_id}", below_average, 23),
+]
+
+# Report
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies: dict, errors: dict, elapsed: float) -> dict:
+    """
+    Returns:
+        dict: `elapsed`, `throughput` and per endpoint `requests`,
+            `errors`, `throughput`, `p50_ms`, `p95_ms` and `p99_ms`
+    """
+    endpoints = {}
+    for name, values in latencies.items():
+        values = sorted(values)
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": errors.get(name, 0),
+            "throughput": len(values) / elapsed,
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+        }
+    total = sum(endpoint["requests"] for endpoint in endpoints.values())
+    return {"elapsed": elapsed, "throughput": total / elapsed, "endpoints": endpoints}
+
+def print_report(results: dict) -> None:
+    print(f"{'endpoint':42} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, endpoint in results["endpoints"].items():
+        print(
+            f"{name:42} {endpoint['requests']:8} {endpoint['errors']:6} {endpoint['throughput']:8.1f} "
+            f"{endpoint['p50_ms']:8.1f} {endpoint['p95_ms']:8.1f} {endpoint['p99_ms']:8.1f}"
+        )
+    print(f"total: {results['throughput']:.1f} req/s over {results['elapsed']:.1f} s")
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns:
+        list: A message for every failed request count and every
+            endpoint whose p95 is over the baseline p95 * (1 + tolerance)
+    """
+    messages = []
+    for name, endpoint in results["endpoints"].items():
+        if endpoint["errors"]:
+            messages.append(f"{name}: {endpoint['errors']} failed requests")
+        reference = baseline["endpoints"].get(name)
+        if reference is not None and endpoint["p95_ms"] > reference["p95_ms"] * (1 + tolerance):
+            messages.append(f"{name}: p95 {endpoint['p95_ms']:.1f} ms, baseline {reference['p95_ms']:.1f} ms")
+    return messages
+
+# Run
+
+async def create_users(client: httpx.AsyncClient, count: int) -> list:
+    for game_id, game_type in GAMES.items():
+        response = await client.post("/games", json={"id": game_id, "game_type": game_type})
+        response.raise_for_status()
+    users = []
+    for index in range(count):
+        user = {"username": f"bench{index}"}
+        response = await client.post("/users", json={
+            "first_name": "Bench",
+            "last_name": "Mark",
+            "email": f"bench{index}@example.com",
+            "username": user["username"],
+            "password": PASSWORD,
+        })
+        response.raise_for_status()
+        (await login(client, user, None)).raise_for_status()
+        users.append(user)
+    return users
+
+async def run(users: int, concurrency: int, requests: int, seed: int) -> dict:
+    database.set_client(AsyncMongoMockClient())
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        accounts = await create_users(client, users)
+        names = [name for name, _, _ in MIX]
+        calls = [call for _, call, _ in MIX]
+        weights = [weight for _, _, weight in MIX]
+        latencies = {name: [] for name in names}
+        errors = {}
+        remaining = requests
+
+        async def virtual_client(index: int) -> None:
+            nonlocal remaining
+            rng = random.Random(seed + index)
+            user = accounts[index % len(accounts)]
+            while remaining > 0:
+                remaining -= 1
+                choice = rng.choices(range(len(MIX)), weights)[0]
+                start = time.perf_counter()
+                response = await calls[choice](client, user, rng)
+                latencies[names[choice]].append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    errors[names[choice]] = errors.get(names[choice], 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(virtual_client(index) for index in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return summarize(latencies, errors, elapsed)
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=4, help="bcrypt cost factor of the benchmark users")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    args = parser.parse_args()
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    try:
+        results = asyncio.run(run(args.users, args.concurrency, args.requests, args.seed))
+    finally:
+        dependencies.shutdown_hashing_pool()
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            messages = regressions(results, json.load(baseline), args.tolerance)
+        for message in messages:
+            print("REGRESSION", message)
+        return 1 if messages else 0
+    return 1 if any(endpoint["errors"] for endpoint in results["endpoints"].values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""
+Login throughput benchmark
+
+Runs `/login` in-process against `mongomock_motor` with bcrypt inline on
+the event loop (`HASHING_WORKERS=0`, the previous behaviour) and in the
+hashing pool, while a probe measures how long a cheap request (`/`)
+waits behind the logins.
+
+Needs the packages of `benchmarks/requirements.txt`.
+
+Usage:
+    python -m benchmarks.login_throughput --logins 200 --concurrency 50 --rounds 12
+"""
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("JWT_SECRET", "benchmark-secret-benchmark-secret")
+
+import httpx
+from mongomock_motor import AsyncMongoMockClient
+from app import database, dependencies
+from app.main import app
+
+async def run(workers: int, logins: int, concurrency: int) -> tuple:
+    """
+    Returns:
+        tuple: (logins per second, worst latency of `/` during the run in ms)
+    """
+    os.environ["HASHING_WORKERS"] = str(workers)
+    os.environ["HASHING_QUEUE_LIMIT"] = str(logins)
+    dependencies.shutdown_hashing_pool()
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as bench_client:
+        async def login():
+            async with semaphore:
+                response = await bench_client.post("/login", data={"username": "bench", "password": "secret"})
+                response.raise_for_status()
+
+        async def probe(done: asyncio.Event) -> float:
+            worst = 0.0
+            while not done.is_set():
+                start = time.perf_counter()
+                await bench_client.get("/")
+                worst = max(worst, time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+            return worst * 1000
+
+        done = asyncio.Event()
+        probe_task = asyncio.create_task(probe(done))
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        return logins / elapsed, await probe_task
+
+async def main(logins: int, concurrency: int, rounds: int) -> None:
+    os.environ["BCRYPT_ROUNDS"] = str(rounds)
+    database.set_client(AsyncMongoMockClient())
+    await database.users_repository.insert({
+        "id": "bench",
+        "username": "bench",
+        "email": "bench@example.com",
+        "first_name": "Bench",
+        "last_name": "Mark",
+        "password": dependencies.get_password_hash("secret", rounds),
+    })
+    for label, workers in (("inline", 0), ("pool", os.cpu_count() or 1)):
+        rate, worst_probe = await run(workers, logins, concurrency)
+        print(f"{label:6} workers={workers:3}: {rate:8.1f} logins/s, worst / latency {worst_probe:8.1f} ms")
+    dependencies.shutdown_hashing_pool()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=12)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.concurrency, args.rounds))
@@ -0,0 +1,99 @@
+"""
+Scoring micro-benchmark and equivalence check
+
+Scores random sessions with the per-round Python loops the endpoints
+used before and with the vectorized `app.scoring.SCORERS`, checks that
+both give the same score for every session, and reports the time per
+session.
+
+Usage:
+    python -m benchmarks.scoring --rounds 10 1000 10000 --sessions 200
+"""
+import argparse
+import math
+import random
+import timeit
+from app.main import GameScoreColor, GameScoreNumber, MemoryGameInput
+from app.scoring import GameTypes, SCORERS
+
+# Reference implementations (previous endpoint loops)
+
+def loop_color_game(score_list) -> float:
+    scores = []
+    for one_game in score_list:
+        current_score = 1 if one_game.userAnswer == one_game.correctAnswer else 0
+        scores.append(current_score * 0.8 + (-one_game.time) * 0.2 / 1000)
+    return sum(scores) + 100
+
+def loop_number_game(score_list) -> float:
+    scores = []
+    for one_game in score_list:
+        _correct = sum(c == u for c, u in zip(one_game.correctAnswer, one_game.userAnswer))
+        correlation = _correct / len(one_game.correctAnswer)
+        scores.append(correlation * 0.8 + (-one_game.time) * 0.2 / 1000)
+    return sum(scores) + 100
+
+def loop_memory_game(score_list) -> float:
+    scores = []
+    for one_game in score_list:
+        scores.append(- one_game.wrongMatches * 0.8 - one_game.time * 0.2 / 1000)
+    return sum(scores) + 100
+
+LOOPS = {
+    GameTypes.color_game: loop_color_game,
+    GameTypes.number_game: loop_number_game,
+    GameTypes.memory_game: loop_memory_game,
+}
+
+# Random sessions
+
+COLORS = ["red", "green", "blue", "yellow"]
+
+def random_session(game_type: GameTypes, rounds: int, rng: random.Random) -> list:
+    if game_type is GameTypes.color_game:
+        return [
+            GameScoreColor(correctAnswer=rng.choice(COLORS), userAnswer=rng.choice(COLORS), time=rng.uniform(0, 5000))
+            for _ in range(rounds)
+        ]
+    if game_type is GameTypes.number_game:
+        return [
+            GameScoreNumber(
+                correctAnswer=[rng.randint(0, 9) for _ in range(rng.randint(1, 8))],
+                userAnswer=[rng.randint(0, 9) for _ in range(rng.randint(0, 8))],
+                time=rng.uniform(0, 5000),
+            )
+            for _ in range(rounds)
+        ]
+    return [MemoryGameInput(wrongMatches=rng.randint(0, 20), time=rng.uniform(0, 5000)) for _ in range(rounds)]
+
+def check_equivalence(sessions: int, rng: random.Random) -> None:
+    """Compare both implementations on random sessions of random length"""
+    for game_type, scorer in SCORERS.items():
+        for _ in range(sessions):
+            score_list = random_session(game_type, rng.randint(0, 300), rng)
+            expected = LOOPS[game_type](score_list)
+            actual = scorer.score(score_list)
+            assert math.isclose(expected, actual, rel_tol=1e-9, abs_tol=1e-9), (game_type, expected, actual)
+    print(f"equivalence: {sessions} random sessions per game type OK")
+
+def main(rounds: list, sessions: int, seed: int) -> None:
+    rng = random.Random(seed)
+    check_equivalence(sessions, rng)
+    for game_type, scorer in SCORERS.items():
+        for n in rounds:
+            score_list = random_session(game_type, n, rng)
+            number = max(1, 20000 // n)
+            loop_time = timeit.timeit(lambda: LOOPS[game_type](score_list), number=number) / number
+            vector_time = timeit.timeit(lambda: scorer.score(score_list), number=number) / number
+            print(
+                f"{game_type.value:12} rounds={n:6}: loop {loop_time * 1e6:10.1f} us,"
+                f" vectorized {vector_time * 1e6:10.1f} us, x{loop_time / vector_time:5.2f}"
+            )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 1000, 10000])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    main(args.rounds, args.sessions, args.seed)
@@ -0,0 +1,89 @@
+"""
+Response serialization benchmark
+
+Serializes a history of played games the way `/users/games/{game_id}`
+did before (raw MongoDB documents validated against `List[UserGames]`
+by FastAPI, then encoded by `JSONResponse`) and the way it does now
+(slotted `UserGameRecord`s encoded by `ORJSONResponse`). Checks both
+bodies decode to the same JSON and reports the time and the peak
+memory allocated per response.
+
+Usage:
+    python -m benchmarks.serialization --rows 10000 --repeat 20
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from app.main import app
+from app.records import UserGameRecord, ORJSONResponse
+
+def make_rows(count: int) -> list:
+    """Documents as returned by `UserGamesRepository.find`"""
+    rng = random.Random(0)
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "score": rng.uniform(-10, 100),
+            "date": start + timedelta(minutes=index, milliseconds=rng.randint(0, 999)),
+            "user_id": "00000000-0000-0000-0000-000000000000",
+            "game_id": 2,
+        }
+        for index in range(count)
+    ]
+
+def history_route():
+    for route in app.routes:
+        if getattr(route, "path", None) == "/users/games/{game_id}":
+            return route
+    raise LookupError("history route not found")
+
+loop = asyncio.new_event_loop()
+
+def pydantic_body(rows: list) -> bytes:
+    content = loop.run_until_complete(
+        serialize_response(field=history_route().response_field, response_content=rows, is_coroutine=True)
+    )
+    return JSONResponse(content).body
+
+def records_body(rows: list) -> bytes:
+    records = [UserGameRecord(row["user_id"], row["game_id"], float(row["score"]), row["date"]) for row in rows]
+    return ORJSONResponse(records).body
+
+def measure(serialize, rows: list, repeat: int) -> tuple:
+    """
+    Returns:
+        tuple: (best time in ms, peak allocated memory in KiB)
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        serialize(rows)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    serialize(rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best * 1000, peak / 1024
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    rows = make_rows(args.rows)
+    assert json.loads(pydantic_body(rows)) == json.loads(records_body(rows)), "bodies differ"
+    results = {}
+    for label, serialize in (("pydantic", pydantic_body), ("records", records_body)):
+        results[label] = measure(serialize, rows, args.repeat)
+        elapsed, peak = results[label]
+        print(f"{label:8} {args.rows} rows: {elapsed:8.2f} ms, peak {peak:10.0f} KiB")
+    print(f"speedup {results['pydantic'][0] / results['records'][0]:.1f}x, "
+          f"memory {results['pydantic'][1] / results['records'][1]:.1f}x less")
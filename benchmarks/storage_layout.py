@@ -0,0 +1,128 @@
+"""
+Storage layout benchmark
+
+Stores the same sessions in the flat layout (`UserGames`, one document
+per played game) and, through `app.migrate_user_games`, in the bucket
+layout (`UserGameBuckets`, one document per user, game and month), then
+reports the size of both collections and of their indexes, and the
+latency of the reads the API makes: a page of history, a full history
+export and the statistics aggregation.
+
+Needs a reachable MongoDB, the benchmark writes into a throwaway database.
+
+Usage:
+    BENCH_MONGO_URI=mongodb://localhost:27017 python -m benchmarks.storage_layout --users 200 --sessions 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+from app import database
+from app.database import UserGamesRepository, BucketedUserGamesRepository
+from app.indexes import INDEXES
+from app.migrate_user_games import migrate
+from app.statistics import _group_stages
+
+BENCH_DB_NAME = "CognitiveBenchmark"
+GAME_IDS = (1, 2, 3, 4)
+
+async def populate(users: int, sessions: int, seed: int) -> list:
+    """
+    Store `sessions` played games per user in the flat layout
+
+    Returns:
+        list: The user ids
+    """
+    db = database.get_database()
+    for name in ("UserGames", "UserGameBuckets"):
+        await db[name].create_indexes(INDEXES[name])
+    rng = random.Random(seed)
+    user_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(users)]
+    start = datetime(2024, 1, 1)
+    repository = UserGamesRepository()
+    for user_id in user_ids:
+        # one session every ~14 hours, spread over the games
+        await repository.insert_many([
+            {
+                "user_id": user_id,
+                "game_id": rng.choice(GAME_IDS),
+                "score": rng.uniform(0, 100),
+                "date": start + timedelta(minutes=index * 840 + rng.randint(0, 600)),
+                "idempotency_key": str(uuid.UUID(int=rng.getrandbits(128))),
+            }
+            for index in range(sessions)
+        ])
+    return user_ids
+
+async def collection_sizes(name: str) -> dict:
+    stats = await database.get_database().command("collStats", name)
+    return {key: stats.get(key, 0) for key in ("count", "size", "storageSize", "totalIndexSize", "avgObjSize")}
+
+def percentiles(samples: list) -> tuple:
+    samples = sorted(samples)
+    return samples[len(samples) // 2] * 1000, samples[int(len(samples) * 0.95)] * 1000
+
+async def timed(samples: list, coroutine) -> None:
+    start = time.perf_counter()
+    await coroutine
+    samples.append(time.perf_counter() - start)
+
+async def read_page(repository, user_id: str, game_id: int, limit: int) -> None:
+    await repository.find(user_id, game_id, limit=limit)
+
+async def export_history(repository, user_id: str) -> None:
+    async for _ in repository.iter_history(user_id):
+        pass
+
+async def aggregate_game(repository, game_id: int) -> None:
+    await repository.aggregate({"game_id": game_id}, _group_stages("$user_id")).to_list(length=None)
+
+async def measure(repository, user_ids: list, reads: int, limit: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    results = {}
+    samples = []
+    for _ in range(reads):
+        await timed(samples, read_page(repository, rng.choice(user_ids), rng.choice(GAME_IDS), limit))
+    results[f"page of {limit}"] = percentiles(samples)
+    samples = []
+    for _ in range(max(1, reads // 10)):
+        await timed(samples, export_history(repository, rng.choice(user_ids)))
+    results["history export"] = percentiles(samples)
+    samples = []
+    for game_id in GAME_IDS:
+        await timed(samples, aggregate_game(repository, game_id))
+    results["statistics"] = percentiles(samples)
+    return results
+
+async def main(uri: str, users: int, sessions: int, reads: int, limit: int, seed: int) -> None:
+    os.environ["MONGO_DB_NAME"] = BENCH_DB_NAME
+    database.set_client(AsyncIOMotorClient(uri, **database.get_client_options()))
+    try:
+        user_ids = await populate(users, sessions, seed)
+        counts = await migrate()
+        print(f"{users * sessions} sessions, {counts['copied']} copied into buckets")
+        for name in ("UserGames", "UserGameBuckets"):
+            sizes = await collection_sizes(name)
+            print(f"{name:16} " + ", ".join(f"{key} {value}" for key, value in sizes.items()))
+        for label, repository in (("flat", UserGamesRepository()), ("bucketed", BucketedUserGamesRepository())):
+            for read, (p50, p95) in (await measure(repository, user_ids, reads, limit, seed)).items():
+                print(f"{label:8} {read:16} p50 {p50:8.2f} ms, p95 {p95:8.2f} ms")
+    finally:
+        MongoClient(uri).drop_database(BENCH_DB_NAME)
+        database.close_client()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uri", default=os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--sessions", type=int, default=500, help="sessions per user")
+    parser.add_argument("--reads", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=100, help="page size")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(main(args.uri, args.users, args.sessions, args.reads, args.limit, args.seed))